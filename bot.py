@@ -197,12 +197,22 @@ async def reply_to_origin_chat(update, context, text, reply_markup=None):
         reply_markup=reply_markup,
     )
 from datetime import datetime, timedelta
+from functools import lru_cache
+from operator import itemgetter
 import io, csv, zipfile
 
 # -----------------------------
 # 工具函数
 # -----------------------------
 
+@lru_cache(maxsize=32)
+def _header_index(header: tuple) -> dict:
+    """Column name -> index for a header row (pass it as a tuple); first occurrence wins."""
+    idx = {}
+    for i, h in enumerate(header):
+        idx.setdefault(h, i)
+    return idx
+
 def build_name_alias(username: str):
     """
     Mao Mong -> {"mao mong", "mao"}
@@ -256,9 +266,21 @@ def get_last_16th_period(now):
     return last_16, this_16
 
 def collect_driver_ot(username, rows, header, start_window, end_window):
-    idx = {h: header.index(h) for h in header}
+    idx = _header_index(tuple(header))
+    i_name = idx["Name"]
+    i_start = idx["Start Date"]
+    i_end = idx["End Date"]
+    i_morning = idx["Morning OT"]
+    i_evening = idx["Evening OT"]
+    i_type = idx["Type"]
 
     valid_names = build_name_alias(username)
+    # ISO dates sort as strings: rows whose YYYY-MM-DD prefix falls outside the window's
+    # dates are dropped before any datetime is built. The rest are still parsed so malformed
+    # cells are skipped as before, but only rows on the first/last day need the exact
+    # 04:00 cut-off comparison.
+    first_day = start_window.strftime("%Y-%m-%d")
+    last_day = end_window.strftime("%Y-%m-%d")
 
     ot150 = []
     ot200 = []
@@ -266,21 +288,24 @@ def collect_driver_ot(username, rows, header, start_window, end_window):
     t200 = 0.0
 
     for r in rows:
-        name = r[idx["Name"]].strip().lower()
+        name = r[i_name].strip().lower()
         if name not in valid_names:
             continue
 
+        start_raw = r[i_start].strip()
+        day = start_raw[:10]
+        if not (first_day <= day <= last_day):
+            continue
         try:
-            start_dt = datetime.fromisoformat(r[idx["Start Date"]].strip())
+            start_dt = datetime.fromisoformat(start_raw)
         except Exception:
             continue
-
-        if not (start_window <= start_dt < end_window):
+        if (day == first_day or day == last_day) and not (start_window <= start_dt < end_window):
             continue
 
         try:
-            m = float(r[idx["Morning OT"]] or 0)
-            e = float(r[idx["Evening OT"]] or 0)
+            m = float(r[i_morning] or 0)
+            e = float(r[i_evening] or 0)
         except Exception:
             continue
 
@@ -289,26 +314,45 @@ def collect_driver_ot(username, rows, header, start_window, end_window):
             continue
 
         row = [
-            r[idx["Start Date"]],
-            r[idx["End Date"]],
+            r[i_start],
+            r[i_end],
             f"{hours:.2f}"
         ]
 
-        if r[idx["Type"]] == "150%":
+        ot_type = r[i_type]
+        if ot_type == "150%":
             ot150.append(row)
             t150 += hours
-        elif r[idx["Type"]] == "200%":
+        elif ot_type == "200%":
             ot200.append(row)
             t200 += hours
 
-    ot150.sort(key=lambda x: x[0])
-    ot200.sort(key=lambda x: x[0])
+    # Rows are appended in date order, so these sorts are near-linear passes.
+    ot150.sort(key=itemgetter(0))
+    ot200.sort(key=itemgetter(0))
 
     return ot150, ot200, round(t150, 2), round(t200, 2)
 
 
+def group_ot_rows_by_name(rows, header):
+    """Bucket OT rows by lower-cased Name so per-driver exports only scan their own rows."""
+    i_name = _header_index(tuple(header))["Name"]
+    groups = {}
+    for r in rows:
+        groups.setdefault(r[i_name].strip().lower(), []).append(r)
+    return groups
+
+
+def driver_ot_rows(groups, username):
+    """Rows for a driver and their name aliases (see build_name_alias)."""
+    aliases = build_name_alias(username)
+    if len(aliases) == 1:
+        return groups.get(next(iter(aliases)), [])
+    return [r for a in sorted(aliases) for r in groups.get(a, ())]
+
+
 def build_csv(username, start_window, end_window, ot150, ot200, t150, t200):
-    out = io.StringIO()
+    out = io.StringIO(newline="")
     w = csv.writer(out)
 
     w.writerow(["Driver", username])
@@ -340,23 +384,23 @@ def build_csv(username, start_window, end_window, ot150, ot200, t150, t200):
 # 入口：选择司机
 # -----------------------------
 
+# Fixed first/last keyboard rows (buttons are immutable, so they are built once).
+_OTR_LAST_16_ROW = (
+    InlineKeyboardButton(
+        "📅 上月16日04:00 → 本月16日04:00",
+        callback_data="OTR_LAST_16"
+    ),
+)
+_OTR_ALL_ROW = (InlineKeyboardButton("📦 Export ALL Drivers", callback_data="OTR_ALL"),)
+
 async def ot_report_entry(update, context):
-    driver_map = get_driver_map()
+    driver_map = await asyncio.to_thread(get_driver_map)
     drivers = sorted(driver_map.keys())
 
-    keyboard = [
-        [InlineKeyboardButton(d, callback_data=f"OTR_ONE:{d}")]
-        for d in drivers
-    ]
-    keyboard.insert(
-        0,
-        [InlineKeyboardButton(
-            "📅 上月16日04:00 → 本月16日04:00",
-            callback_data="OTR_LAST_16"
-        )]
-    )
-    keyboard.append(
-        [InlineKeyboardButton("📦 Export ALL Drivers", callback_data="OTR_ALL")]
+    keyboard = (
+        _OTR_LAST_16_ROW,
+        *((InlineKeyboardButton(d, callback_data="OTR_ONE:" + d),) for d in drivers),
+        _OTR_ALL_ROW,
     )
 
     await context.bot.send_message(
@@ -378,8 +422,8 @@ async def ot_report_driver_callback(update, context):
     except Exception:
         pass
 
-    ws = open_worksheet("OT Record")
-    rows = ws.get_all_values()
+    # Sheet I/O runs in a worker thread so the event loop keeps serving other updates.
+    rows = await asyncio.to_thread(_cached_values, "OT Record")
     if not rows or len(rows) < 2:
         # 空表或只有 header，直接返回，不生成文件
         return
@@ -413,23 +457,18 @@ async def ot_report_driver_callback(update, context):
         return
     # ---------- 上个月16日 → 本月16日（历史 OT） ----------
     if query.data == "OTR_LAST_16":
-        ws = open_worksheet("OT Record")
-        rows = ws.get_all_values()
-        if not rows or len(rows) < 2:
-            return
-
-        header, data = rows[0], rows[1:]
-
+        # Same rows as above; only the window differs.
         start_window, end_window = get_last_16th_period(_now_dt())
 
-        driver_map = get_driver_map()
+        driver_map = await asyncio.to_thread(get_driver_map)
         drivers = sorted(driver_map.keys())
+        groups = group_ot_rows_by_name(data, header)
 
         zip_buf = io.BytesIO()
         with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as zf:
             for username in drivers:
                 ot150, ot200, t150, t200 = collect_driver_ot(
-                    username, data, header, start_window, end_window
+                    username, driver_ot_rows(groups, username), header, start_window, end_window
                 )
     
                 if not ot150 and not ot200:
@@ -463,14 +502,15 @@ async def ot_report_driver_callback(update, context):
         return
     # ---------- 所有司机 ----------
     if query.data == "OTR_ALL":
-        driver_map = get_driver_map()
+        driver_map = await asyncio.to_thread(get_driver_map)
         drivers = sorted(driver_map.keys())
+        groups = group_ot_rows_by_name(data, header)
 
         zip_buf = io.BytesIO()
         with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as zf:
             for username in drivers:
                 ot150, ot200, t150, t200 = collect_driver_ot(
-                    username, data, header, start_window, end_window
+                    username, driver_ot_rows(groups, username), header, start_window, end_window
                 )
 
                 if not ot150 and not ot200:
@@ -619,6 +659,7 @@ def append_ot_record(driver, start_dt, end_dt, morning_h, evening_h, ot_type_str
                 ws.append_row(row, value_input_option="USER_ENTERED")
             except Exception:
                 ws.append_row(row)
+            _drop_cached_values(tab_name)
 
         except Exception:
             logger.exception("Failed to append OT record row for %s", driver)
@@ -703,10 +744,7 @@ def record_clock_entry(driver: str, action: str, note: str = ""):
     try:
         ensure_sheet_headers_match(ws, OT_HEADERS)
     except Exception:
-        try:
-            logger.exception("Failed to ensure/update OT_TAB headers")
-        except Exception:
-            pass
+        _safe_log_exception("Failed to ensure/update OT_TAB headers")
 
     row = [
         dt.strftime("%Y-%m-%d"),
@@ -823,7 +861,7 @@ async def clock_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
 # Edit the inline-button message as a confirmation
 
     try:
-        user_lang = context.user_data.get("lang", DEFAULT_LANG)
+        user_lang = _resolve_lang(update, context)
         ts_str = ts_dt.strftime("%Y-%m-%d %H:%M:%S")
 
         await query.edit_message_text(t(user_lang,"clock_in" if action == "IN" else "clock_out",driver=driver,ts=ts_str))
@@ -831,15 +869,22 @@ async def clock_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
         # Fallback: ignore edit errors
         pass
         
+import asyncio
 import json
 import base64
+import hashlib
 import logging
 import uuid
-import urllib.request
 import re
+from collections import ChainMap, defaultdict
+from contextlib import suppress
+from functools import lru_cache
+from types import SimpleNamespace
 from typing import Optional, Dict, List
 import gspread
+import httpx
 import time
+from datetime import time as dtime
 try:
     from zoneinfo import ZoneInfo
 except Exception:
@@ -859,6 +904,11 @@ logging.basicConfig(level=logging.INFO)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger("driver-bot")
 
+def _safe_log_exception(msg, *args):
+    """logger.exception for best-effort error paths; never raises itself."""
+    with suppress(Exception):
+        logger.exception(msg, *args)
+
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
@@ -869,6 +919,14 @@ PLATE_LIST = os.getenv(
 GOOGLE_SHEET_NAME = os.getenv("GOOGLE_SHEET_NAME", "Driver_Log")
 GOOGLE_SHEET_TAB = os.getenv("GOOGLE_SHEET_TAB", "")
 
+# Config presence flags for the /debug_bot and startup reports (env is fixed after start).
+_ENV = SimpleNamespace(
+    bot_token=bool(os.getenv("BOT_TOKEN")),
+    sheet_id=os.getenv("SHEET_ID") or os.getenv("GOOGLE_SHEET_NAME") or "",
+    creds=bool(os.getenv("GOOGLE_CREDS_B64") or os.getenv("GOOGLE_CREDS_BASE64") or os.getenv("GOOGLE_CREDS_PATH")),
+    menu_or_summary_chat=os.getenv("MENU_CHAT_ID") or os.getenv("SUMMARY_CHAT_ID") or "",
+)
+
 _env_tz = os.getenv("LOCAL_TZ")
 if _env_tz is None:
     LOCAL_TZ = "Asia/Phnom_Penh"
@@ -880,7 +938,7 @@ DRIVER_PLATE_MAP_JSON = os.getenv("DRIVER_PLATE_MAP", "").strip() or None
 
 DEFAULT_LANG = os.getenv("LANG", "en").lower()
 
-SUPPORTED_LANGS = ("en", "km")
+SUPPORTED_LANGS = frozenset(("en", "km"))
 
 # ===== 在这里新增 =====
 def ensure_user_lang(update, context):
@@ -914,6 +972,17 @@ def ensure_user_lang(update, context):
 RECORDS_TAB = os.getenv("RECORDS_TAB", "Driver_Log")
 DRIVERS_TAB = os.getenv("DRIVERS_TAB", "Drivers")
 SUMMARY_TAB = os.getenv("SUMMARY_TAB", "Summary")
+SUMMARY_CHAT_ID = os.getenv("SUMMARY_CHAT_ID")
+SUMMARY_HOUR = int(os.getenv("SUMMARY_HOUR", "8"))
+SUMMARY_TZ = os.getenv("SUMMARY_TZ") or LOCAL_TZ
+
+# Resolved once; the daily summary job reuses it on every run.
+_SUMMARY_TZ = None
+if SUMMARY_TZ and ZoneInfo:
+    try:
+        _SUMMARY_TZ = ZoneInfo(SUMMARY_TZ)
+    except Exception:
+        _SUMMARY_TZ = None
 MISSIONS_TAB = os.getenv("MISSIONS_TAB", "Missions")
 MISSIONS_REPORT_TAB = os.getenv("MISSIONS_REPORT_TAB", "Missions_Report")
 LEAVE_TAB = os.getenv("LEAVE_TAB", "Driver_Leave")
@@ -975,7 +1044,13 @@ if not os.getenv("GOOGLE_CREDS_B64") and os.getenv("GOOGLE_CREDS_BASE64"):
 _LOADED_MISSION_CYCLES = {}
 
 # --- Google Sheets client (single, authoritative implementation) ---
+# The authorized client refreshes its own access token, so one instance serves the process.
+_GSPREAD_CLIENT = None
+
 def _get_gspread_client():
+    global _GSPREAD_CLIENT
+    if _GSPREAD_CLIENT is not None:
+        return _GSPREAD_CLIENT
     b64 = os.getenv("GOOGLE_CREDS_B64")
     if not b64:
         raise RuntimeError(
@@ -996,9 +1071,14 @@ def _get_gspread_client():
         # Fallback for legacy credentials without scopes
         creds = service_account.Credentials.from_service_account_info(info)
 
-    return gspread.authorize(creds)
+    _GSPREAD_CLIENT = gspread.authorize(creds)
+    return _GSPREAD_CLIENT
 
 # --- Bot-state worksheet helper ---
+# Every Bot_State writer (mission-cycle timer thread, language to_thread workers) takes this
+# lock, so a "find the row, then write it" sequence can't pick the same free row twice.
+_BOT_STATE_WRITE_LOCK = threading.Lock()
+
 def open_bot_state_worksheet():
     gc = _get_gspread_client()
 
@@ -1042,33 +1122,72 @@ def load_mission_cycles_from_sheet():
         _LOADED_MISSION_CYCLES = {}
         return _LOADED_MISSION_CYCLES
 
-    except Exception:
+    except Exception as e:
+        _drop_sheet_handles(e)
         _LOADED_MISSION_CYCLES = {}
         return _LOADED_MISSION_CYCLES
 
 # --- Save mission cycles to Bot_State sheet ---
 def save_mission_cycles_to_sheet(mdict):
     try:
-        ws = open_bot_state_worksheet()
-        records = ws.get_all_records()
-
-        found_row = None
-        for idx, r in enumerate(records, start=2):
-            k = r.get("Key") or r.get("key")
-            if k == "mission_cycle":
-                found_row = idx
-                break
-
         json_val = json.dumps(mdict, ensure_ascii=False)
+        with _BOT_STATE_WRITE_LOCK:
+            ws = open_bot_state_worksheet()
+            records = ws.get_all_records()
+
+            found_row = None
+            for idx, r in enumerate(records, start=2):
+                k = r.get("Key") or r.get("key")
+                if k == "mission_cycle":
+                    found_row = idx
+                    break
 
-        if found_row:
-            ws.update(f"B{found_row}", json_val)
-        else:
-            ws.append_row(["mission_cycle", json_val])
+            if found_row:
+                ws.update(f"B{found_row}", json_val)
+            else:
+                ws.append_row(["mission_cycle", json_val])
 
     except Exception as e:
+        _drop_sheet_handles(e)
         logger.exception("Failed to save mission cycles to sheet: %s", e)
 
+# --- Debounced write-behind for mission cycles ---
+# Handlers only record the latest snapshot; a single timer flushes it to the
+# sheet, so an increment followed by a reset costs one write instead of two.
+_MISSION_CYCLE_SAVE_DELAY = 2.0  # seconds
+_mission_cycle_save_lock = threading.Lock()
+_mission_cycle_pending = None
+_mission_cycle_timer = None
+
+def _flush_mission_cycles():
+    global _mission_cycle_pending, _mission_cycle_timer
+    with _mission_cycle_save_lock:
+        mdict = _mission_cycle_pending
+        _mission_cycle_pending = None
+        _mission_cycle_timer = None
+    if mdict is not None:
+        save_mission_cycles_to_sheet(mdict)
+
+def schedule_mission_cycles_save(mdict):
+    """Queue mission cycles for persistence; writes within the delay are coalesced."""
+    global _mission_cycle_pending, _mission_cycle_timer
+    with _mission_cycle_save_lock:
+        _mission_cycle_pending = dict(mdict)
+        if _mission_cycle_timer is None:
+            _mission_cycle_timer = threading.Timer(_MISSION_CYCLE_SAVE_DELAY, _flush_mission_cycles)
+            _mission_cycle_timer.daemon = True
+            _mission_cycle_timer.start()
+
+async def flush_mission_cycles_on_shutdown(application):
+    """post_shutdown hook: write any save still waiting on the daemon timer (e.g. on redeploy)."""
+    with _mission_cycle_save_lock:
+        timer = _mission_cycle_timer
+    if timer is not None:
+        timer.cancel()
+        # If it already fired, let the in-flight write finish before the process exits.
+        await asyncio.to_thread(timer.join, 10.0)
+    await asyncio.to_thread(_flush_mission_cycles)
+
 
 
 # Simple thread-based serial executor to avoid 429s.
@@ -1147,6 +1266,8 @@ class WorksheetProxy:
         func = getattr(self._ws, fn_name)
         ok, res = _api_queue.submit(func, *args, **kwargs)
         if not ok:
+            # A revoked token or a deleted/renamed tab leaves the cached handles unusable.
+            _drop_sheet_handles(res)
             # raise original exception
             raise res
         return res
@@ -1158,7 +1279,6 @@ class WorksheetProxy:
             return cache[1]
         # call
         vals = self._submit("get_all_values", *args, **kwargs)
-        _sheets_read_cache.clear()
         _sheets_read_cache[self._key] = (time.time(), vals)
         return vals
 
@@ -1196,6 +1316,21 @@ class WorksheetProxy:
         _sheets_read_cache.pop(self._key, None)
         return res
 
+    def batch_update(self, *args, **kwargs):
+        res = self._submit("batch_update", *args, **kwargs)
+        _sheets_read_cache.pop(self._key, None)
+        return res
+
+    def append_rows(self, *args, **kwargs):
+        res = self._submit("append_rows", *args, **kwargs)
+        _sheets_read_cache.pop(self._key, None)
+        return res
+
+    def clear(self, *args, **kwargs):
+        res = self._submit("clear", *args, **kwargs)
+        _sheets_read_cache.pop(self._key, None)
+        return res
+
     def delete_rows(self, *args, **kwargs):
         # gspread newer method name; support both delete_rows and delete_row
         if hasattr(self._ws, "delete_rows"):
@@ -1223,6 +1358,7 @@ class WorksheetProxy:
             def _callable(*a, **k):
                 ok, res = _api_queue.submit(getattr(self._ws, name), *a, **k)
                 if not ok:
+                    _drop_sheet_handles(res)
                     raise res
                 # Invalidate cache on any write-like operations heuristically
                 if name.startswith(("append", "update", "delete", "insert")):
@@ -1327,26 +1463,41 @@ TR = {
     },
 }
 
+@lru_cache(maxsize=2048)
+def _resolve_template(lang: str, key: str) -> str:
+    """Template for key in lang, falling back to English. Clear the cache after patching TR."""
+    en = TR.get("en", {})
+    return TR.get(lang, en).get(key, en.get(key, ""))
+
 def t(user_lang: Optional[str], key: str, **kwargs) -> str:
     lang = (user_lang or DEFAULT_LANG or "en").lower()
     if lang not in SUPPORTED_LANGS:
         lang = "en"
-    return TR.get(lang, TR["en"]).get(key, TR["en"].get(key, "")).format(**kwargs)
+    return _resolve_template(lang, key).format(**kwargs)
+
 
+# (worksheet title, header tuple) pairs already checked or fixed in this process; the
+# header row only changes through this helper, so later opens skip the full read.
+_HEADERS_VERIFIED = set()
 
 def ensure_sheet_headers_match(ws, headers: List[str]):
+    title = getattr(ws, "title", None)
+    want = tuple(str(c).strip() for c in headers)
+    if title and (title, want) in _HEADERS_VERIFIED:
+        return
     try:
         values = ws.get_all_values()
         if not values:
             ws.insert_row(headers, index=1)
             return
         first_row = values[0]
-        norm_first = [str(c).strip() for c in first_row]
-        norm_headers = [str(c).strip() for c in headers]
-        if norm_first != norm_headers:
+        # Lazy compare: stops at the first differing cell.
+        if len(first_row) != len(want) or any(str(c).strip() != h for c, h in zip(first_row, want)):
             rng = f"A1:{chr(ord('A') + len(headers) - 1)}1"
             ws.update(rng, [headers], value_input_option="USER_ENTERED")
             logger.info("Updated header row on %s", getattr(ws, "title", "<ws>"))
+        if title:
+            _HEADERS_VERIFIED.add((title, want))
     except Exception:
         logger.exception("Failed to ensure/update headers on %s", getattr(ws, "title", "<ws>"))
 
@@ -1385,7 +1536,52 @@ def _missions_header_fix_if_needed(ws):
     except Exception:
         logger.exception("Error checking/fixing missions header.")
 
+# Opened spreadsheet / worksheet handles. Opening by name costs a Drive lookup plus a
+# metadata fetch, and every handler opens its tab, so handles are reused for a while.
+_HANDLE_CACHE_TTL = 600.0  # seconds
+_main_sheet_cache: Dict[str, Tuple[float, Any]] = {}
+_worksheet_cache: Dict[str, Tuple[float, Any]] = {}
+
+def _drop_sheet_handles(exc: Optional[BaseException] = None) -> None:
+    """Forget the cached client and handles after an auth/not-found API error (or always if exc is None)."""
+    global _GSPREAD_CLIENT
+    if exc is not None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+        if status not in (401, 403, 404):
+            return
+    _GSPREAD_CLIENT = None
+    _main_sheet_cache.clear()
+    _worksheet_cache.clear()
+
+def _open_spreadsheet_cached(name: str = "", key: str = ""):
+    """Open a spreadsheet by name (or by key when no name is given), reusing the handle for _HANDLE_CACHE_TTL."""
+    cache_key = name or "id:" + key
+    hit = _main_sheet_cache.get(cache_key)
+    if hit and time.monotonic() - hit[0] < _HANDLE_CACHE_TTL:
+        return hit[1]
+    gc = _get_gspread_client()
+    sh = gc.open(name) if name else gc.open_by_key(key)
+    _main_sheet_cache[cache_key] = (time.monotonic(), sh)
+    return sh
+
+def _open_main_spreadsheet():
+    """Return the GOOGLE_SHEET_NAME spreadsheet, re-opening it at most every _HANDLE_CACHE_TTL."""
+    return _open_spreadsheet_cached(name=GOOGLE_SHEET_NAME)
+
 def open_worksheet(tab: str = ""):
+    """Open a worksheet (see _open_worksheet_uncached), reusing the handle for _HANDLE_CACHE_TTL.
+
+    Only the handle is cached; values still go through _sheets_read_cache and the
+    API queue on every read.
+    """
+    hit = _worksheet_cache.get(tab)
+    if hit and time.monotonic() - hit[0] < _HANDLE_CACHE_TTL:
+        return hit[1]
+    ws = _open_worksheet_uncached(tab)
+    _worksheet_cache[tab] = (time.monotonic(), ws)
+    return ws
+
+def _open_worksheet_uncached(tab: str = ""):
     """Open a worksheet with minimal header enforcement and wrap it in WorksheetProxy.
 
     This central helper applies:
@@ -1400,8 +1596,7 @@ def open_worksheet(tab: str = ""):
             # If proxying somehow fails, fall back to raw worksheet
             return ws
 
-    gc = _get_gspread_client()
-    sh = gc.open(GOOGLE_SHEET_NAME)
+    sh = _open_main_spreadsheet()
 
     def _create_tab(name: str, headers: Optional[List[str]] = None):
         try:
@@ -1444,6 +1639,48 @@ def open_worksheet(tab: str = ""):
         # Default to first sheet, wrapped
         return _wrap_ws(sh.sheet1)
 
+_REPORT_CACHE_TTL = 60.0  # seconds; reporting reads tolerate slightly stale rows
+
+def _cached_values(tab: str, ttl: float = _REPORT_CACHE_TTL) -> List[List[str]]:
+    """Return get_all_values() for a tab, reusing _sheets_read_cache for up to ttl seconds.
+
+    A cache hit skips open_worksheet() entirely. The bot's own write paths call
+    _drop_cached_values(tab), so a report asked for right after a write sees the new rows.
+    """
+    hit = _sheets_read_cache.get(tab)
+    if hit and (time.time() - hit[0]) < ttl:
+        return hit[1]
+    return open_worksheet(tab).get_all_values()
+
+def _drop_cached_values(tab: str) -> None:
+    """Forget the cached values of a tab after writing to it."""
+    _sheets_read_cache.pop(tab, None)
+
+def _batch_fetch_tabs(tabs: List[str]) -> Dict[str, List[List[str]]]:
+    """Fetch several tabs with one values.batchGet call and seed _sheets_read_cache.
+
+    Rows are padded to a rectangle so callers see the same shape as get_all_values().
+    Failures are logged and leave the cache untouched; readers then fall back to
+    fetching each tab on their own.
+    """
+    out: Dict[str, List[List[str]]] = {}
+    try:
+        sh = _open_main_spreadsheet()
+        ranges = ["'" + tab.replace("'", "''") + "'" for tab in tabs]
+        ok, res = _api_queue.submit(sh.values_batch_get, ranges)
+        if not ok:
+            raise res
+        now = time.time()
+        for tab, vr in zip(tabs, res.get("valueRanges", [])):
+            rows = vr.get("values", [])
+            width = max((len(r) for r in rows), default=0)
+            vals = [r + [""] * (width - len(r)) for r in rows]
+            _sheets_read_cache[tab] = (now, vals)
+            out[tab] = vals
+    except Exception:
+        logger.exception("Batch fetch failed for tabs %s", tabs)
+    return out
+
 async def process_leave_entry(ws, driver, start, end, reason, notes, update, context, pending_leave, user):
     """Helper to append leave row with Leave Days, check duplicates and exclude weekends/holidays."""
     try:
@@ -1602,8 +1839,14 @@ def now_str() -> str:
 def today_date_str() -> str:
     return _now_dt().strftime(DATE_FMT)
 
+@lru_cache(maxsize=8192)
 def parse_ts(ts: str) -> Optional[datetime]:
+    # Sheet scans see the same timestamps over and over; datetimes are immutable so caching is safe.
+    # Exact "YYYY-MM-DD HH:MM:SS" strings take the C fromisoformat path (much cheaper than
+    # strptime); anything else still goes through strptime so accepted input is unchanged.
     try:
+        if len(ts) == 19 and ts[10] == " " and ts[13] == ":" and ts[16] == ":":
+            return datetime.fromisoformat(ts)
         return datetime.strptime(ts, TS_FMT)
     except Exception:
         return None
@@ -1636,11 +1879,23 @@ def record_start_trip(driver: str, plate: str) -> dict:
         logger.exception("Failed to append start trip")
         return {"ok": False, "message": "Failed to write start trip to sheet: " + str(e)}
 
+# RECORDS_TAB header layout is stable for the life of the sheet; detect it once.
+_RECORDS_START_IDX: Optional[int] = None
+
+def _records_start_idx(vals: List[List[Any]]) -> int:
+    """Return 1 if RECORDS_TAB values start with a header row, else 0 (cached)."""
+    global _RECORDS_START_IDX
+    if _RECORDS_START_IDX is None:
+        if not vals or not vals[0]:
+            return 0
+        _RECORDS_START_IDX = 1 if any("date" in c.lower() for c in vals[0] if c) else 0
+    return _RECORDS_START_IDX
+
 def record_end_trip(driver: str, plate: str) -> dict:
     ws = open_worksheet(RECORDS_TAB)
     try:
         rows = ws.get_all_values()
-        start_idx = 1 if rows and any("date" in c.lower() for c in rows[0] if c) else 0
+        start_idx = _records_start_idx(rows)
         for idx in range(len(rows) - 1, start_idx - 1, -1):
             rec = rows[idx]
             rec_plate = rec[2] if len(rec) > 2 else ""
@@ -1679,7 +1934,9 @@ def record_end_trip(driver: str, plate: str) -> dict:
         return {"ok": False, "message": "Failed to write end trip to sheet: " + str(e)}
 
 def _missions_get_values_and_data_rows(ws):
-    values = ws.get_all_values()
+    return _missions_split_header(ws.get_all_values())
+
+def _missions_split_header(values):
     if not values:
         return [], 0
     first_row = values[0]
@@ -1768,29 +2025,20 @@ def end_mission_record(driver: str, plate: str, arrival: str, update=None) -> di
                 row_number = i + 1
                 end_ts = now_str()
 
+                # End, arrival and mission days go out in one values.batchUpdate; a failure
+                # propagates to the handler below instead of retrying cell by cell.
+                cells = [(M_IDX_END, end_ts), (M_IDX_ARRIVAL, arrival)]
                 try:
-                    ws.update_cell(row_number, M_IDX_END + 1, end_ts)
-                    ws.update_cell(row_number, M_IDX_ARRIVAL + 1, arrival)
-                    try:
-                        start_dt = datetime.fromisoformat(rec_start)
-                        end_dt = datetime.fromisoformat(end_ts)
-                        mission_days = calc_mission_days(start_dt, end_dt)
-                        ws.update_cell(row_number, M_IDX_MISSION_DAYS + 1, mission_days)
-                    except Exception as e:
-                        logger.warning("Failed to write mission days: %s", e)
-                except Exception:
-                    existing = ws.row_values(row_number)
-                    existing = _ensure_row_length(existing, M_MANDATORY_COLS)
-                    existing[M_IDX_END] = end_ts
-                    existing[M_IDX_ARRIVAL] = arrival
-                    try:
-                        start_dt = datetime.fromisoformat(rec_start)
-                        end_dt = datetime.fromisoformat(end_ts)
-                        existing[M_IDX_MISSION_DAYS] = calc_mission_days(start_dt, end_dt)
-                    except Exception:
-                        existing[M_IDX_MISSION_DAYS] = ""
-                    ws.delete_rows(row_number)
-                    ws.insert_row(existing, row_number)
+                    start_dt = datetime.fromisoformat(rec_start)
+                    end_dt = datetime.fromisoformat(end_ts)
+                    cells.append((M_IDX_MISSION_DAYS, calc_mission_days(start_dt, end_dt)))
+                except Exception as e:
+                    logger.warning("Failed to write mission days: %s", e)
+                ws.batch_update(
+                    [{"range": gspread.utils.rowcol_to_a1(row_number, col + 1), "values": [[val]]} for col, val in cells],
+                    value_input_option="USER_ENTERED",
+                )
+                _drop_cached_values(MISSIONS_TAB)
 
                 logger.info(
                     "Mission end recorded: driver=%s plate=%s end=%s",
@@ -1810,6 +2058,8 @@ def end_mission_record(driver: str, plate: str, arrival: str, update=None) -> di
                 window_start = s_dt - timedelta(hours=ROUNDTRIP_WINDOW_HOURS)
                 window_end = s_dt + timedelta(hours=ROUNDTRIP_WINDOW_HOURS)
 
+                # vals may have come from the 10 s read cache, so re-read after the write
+                # (the cache entry was dropped above) to see rows closed meanwhile.
                 vals2, start_idx2 = _missions_get_values_and_data_rows(ws)
                 candidates = []
 
@@ -1881,11 +2131,14 @@ def end_mission_record(driver: str, plate: str, arrival: str, update=None) -> di
                     return_start = rec_start
                     return_end = end_ts
 
-                ws.update_cell(primary_row, M_IDX_ROUNDTRIP + 1, "Yes")
-                ws.update_cell(primary_row, M_IDX_RETURN_START + 1, return_start)
-                ws.update_cell(primary_row, M_IDX_RETURN_END + 1, return_end)
+                ws.batch_update([
+                    {"range": gspread.utils.rowcol_to_a1(primary_row, M_IDX_ROUNDTRIP + 1), "values": [["Yes"]]},
+                    {"range": gspread.utils.rowcol_to_a1(primary_row, M_IDX_RETURN_START + 1), "values": [[return_start]]},
+                    {"range": gspread.utils.rowcol_to_a1(primary_row, M_IDX_RETURN_END + 1), "values": [[return_end]]},
+                ], value_input_option="USER_ENTERED")
 
                 ws.delete_rows(secondary_row)
+                _drop_cached_values(MISSIONS_TAB)
 
                 return {
                     "ok": True,
@@ -1902,16 +2155,21 @@ def end_mission_record(driver: str, plate: str, arrival: str, update=None) -> di
         return {"ok": False, "message": str(e)}
 
 
-def mission_rows_for_period(start_date: datetime, end_date: datetime) -> List[List[Any]]:
-    ws = open_worksheet(MISSIONS_TAB)
-    out = []
+def scan_missions_for_period(start_date: datetime, end_date: datetime) -> Tuple[List[List[Any]], Dict[str, int]]:
+    """Single pass over MISSIONS_TAB returning (report rows, roundtrip counts per driver)."""
+    out: List[List[Any]] = []
+    counts: Dict[str, int] = {}
+    # Column indices bound to locals once; the loop below runs for every mission row.
+    i_name, i_plate, i_start = M_IDX_NAME, M_IDX_PLATE, M_IDX_START
+    i_depart, i_arrival, i_roundtrip = M_IDX_DEPART, M_IDX_ARRIVAL, M_IDX_ROUNDTRIP
+    i_return_end, i_days = M_IDX_RETURN_END, M_IDX_MISSION_DAYS
     try:
-        vals, start_idx = _missions_get_values_and_data_rows(ws)
+        vals, start_idx = _missions_split_header(_cached_values(MISSIONS_TAB))
         for r in vals[start_idx:]:
             r = _ensure_row_length(r, M_MANDATORY_COLS)
 
             # Period 仍然按 Start Date 判断
-            start_raw = str(r[M_IDX_START]).strip()
+            start_raw = str(r[i_start]).strip()
             if not start_raw:
                 continue
 
@@ -1920,33 +2178,41 @@ def mission_rows_for_period(start_date: datetime, end_date: datetime) -> List[Li
                 continue
 
             # ✅ Start：直接引用 Start Date
-            start_val = r[M_IDX_START]
+            start_val = r[i_start]
 
             # ✅ End：改为引用 Return End
-            end_val = r[M_IDX_RETURN_END]
+            end_val = r[i_return_end]
 
             # ✅ Mission Days：直接引用 Missions 表
-            md = r[M_IDX_MISSION_DAYS]
+            md = r[i_days]
 
             # ✅ Return = Departure
-            ret = r[M_IDX_DEPART]
+            ret = r[i_depart]
 
             out.append([
-                r[M_IDX_NAME],     # Driver
-                r[M_IDX_PLATE],    # Plate
+                r[i_name],         # Driver
+                r[i_plate],        # Plate
                 start_val,         # Start (Start Date)
                 end_val,           # End (Return End)
                 md,                # Mission days（直接引用）
-                r[M_IDX_DEPART],   # Departure
-                r[M_IDX_ARRIVAL],  # Arrival
+                r[i_depart],       # Departure
+                r[i_arrival],      # Arrival
                 ret,               # Return（= Departure）
             ])
 
-        return out
+            if str(r[i_roundtrip]).strip().lower() == "yes":
+                name = str(r[i_name]).strip() or "Unknown"
+                counts[name] = counts.get(name, 0) + 1
+
+        return out, counts
 
     except Exception:
         logger.exception("Failed to fetch mission rows")
-        return []
+        return [], {}
+
+def mission_rows_for_period(start_date: datetime, end_date: datetime) -> List[List[Any]]:
+    return scan_missions_for_period(start_date, end_date)[0]
+
 def count_trips_for_day(driver: str, date_dt: datetime) -> int:
     cnt = 0
     try:
@@ -1954,7 +2220,7 @@ def count_trips_for_day(driver: str, date_dt: datetime) -> int:
         vals = ws.get_all_values()
         if not vals:
             return 0
-        start_idx = 1 if any("date" in c.lower() for c in vals[0] if c) else 0
+        start_idx = _records_start_idx(vals)
         for r in vals[start_idx:]:
             if len(r) < COL_START:
                 continue
@@ -1981,7 +2247,7 @@ def count_trips_for_month(driver: str, month_start: datetime, month_end: datetim
         vals = ws.get_all_values()
         if not vals:
             return 0
-        start_idx = 1 if any("date" in c.lower() for c in vals[0] if c) else 0
+        start_idx = _records_start_idx(vals)
         for r in vals[start_idx:]:
             if len(r) < COL_START:
                 continue
@@ -2008,15 +2274,6 @@ def write_mission_report_rows(rows: List[List[Any]], period_label: str) -> bool:
         # 每次生成前清空
         ws.clear()
 
-        ws.append_row([f"Report: {period_label}"], value_input_option="USER_ENTERED")
-        ws.append_row(["Period", period_label, "", "", "", "", "", ""], value_input_option="USER_ENTERED")
-
-        # ✅ Header（新增 Return）
-        ws.append_row(
-            ["Driver", "Plate", "Start", "End", "Mission days", "Departure", "Arrival", "Return"],
-            value_input_option="USER_ENTERED"
-        )
-
         total_mission_days = 0
 
         for r in rows:
@@ -2024,12 +2281,17 @@ def write_mission_report_rows(rows: List[List[Any]], period_label: str) -> bool:
                 total_mission_days += int(str(r[4]).strip())
             except Exception:
                 pass
-            ws.append_row(r, value_input_option="USER_ENTERED")
 
-        ws.append_row(
+        # Whole report in one append_rows call instead of one append_row per line.
+        payload = [
+            [f"Report: {period_label}"],
+            ["Period", period_label, "", "", "", "", "", ""],
+            # ✅ Header（新增 Return）
+            ["Driver", "Plate", "Start", "End", "Mission days", "Departure", "Arrival", "Return"],
+            *rows,
             ["Total Mission days", "", "", "", total_mission_days, "",  "", "",],
-            value_input_option="USER_ENTERED"
-        )
+        ]
+        ws.append_rows(payload, value_input_option="USER_ENTERED")
 
         return True
 
@@ -2038,26 +2300,7 @@ def write_mission_report_rows(rows: List[List[Any]], period_label: str) -> bool:
         return False
 
 def count_roundtrips_per_driver_month(start_date: datetime, end_date: datetime) -> Dict[str, int]:
-    counts: Dict[str, int] = {}
-    try:
-        ws = open_worksheet(MISSIONS_TAB)
-        vals, start_idx = _missions_get_values_and_data_rows(ws)
-        for r in vals[start_idx:]:
-            r = _ensure_row_length(r, M_MANDATORY_COLS)
-            start = str(r[M_IDX_START]).strip()
-            if not start:
-                continue
-            s_dt = parse_ts(start)
-            if not s_dt or not (start_date <= s_dt < end_date):
-                continue
-            rt = str(r[M_IDX_ROUNDTRIP]).strip().lower()
-            if rt != "yes":
-                continue
-            name = str(r[M_IDX_NAME]).strip() or "Unknown"
-            counts[name] = counts.get(name, 0) + 1
-    except Exception:
-        logger.exception("Failed to count roundtrips per driver")
-    return counts
+    return scan_missions_for_period(start_date, end_date)[1]
 
 AMOUNT_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*$', re.I)
 ODO_RE = re.compile(r'^\s*(\d+)(?:\s*km)?\s*$', re.I)
@@ -2279,8 +2522,10 @@ def record_toll(plate: str, amount: str, by_user: str = "", notes: str = "") ->
         return {"ok": False, "message": str(e)}
 
 
-BOT_ADMINS = set([u.strip() for u in os.getenv("BOT_ADMINS", BOT_ADMINS_DEFAULT).split(",") if u.strip()])
-BOT_ADMINS.add("markpeng1,kmnyy,ClaireRin777")
+BOT_ADMINS = frozenset(
+    [u.strip() for u in os.getenv("BOT_ADMINS", BOT_ADMINS_DEFAULT).split(",") if u.strip()]
+    + ["markpeng1,kmnyy,ClaireRin777"]
+)
 
 def build_plate_keyboard(prefix: str, allowed_plates: Optional[List[str]] = None):
     buttons = []
@@ -2308,7 +2553,7 @@ async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.effective_message.delete()
     except Exception:
         pass
-    user_lang = context.user_data.get("lang", DEFAULT_LANG)
+    user_lang = _resolve_lang(update, context)
     text = t(user_lang, "menu")
     keyboard = [
         [InlineKeyboardButton("Clock In", callback_data="clock_in"), InlineKeyboardButton("Clock Out", callback_data="clock_out")],
@@ -2336,7 +2581,7 @@ async def start_trip_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     allowed = None
     if user and user.username and driver_map.get(user.username):
         allowed = driver_map.get(user.username)
-    await update.effective_chat.send_message(t(context.user_data.get("lang", DEFAULT_LANG), "choose_start"), reply_markup=build_plate_keyboard("start", allowed_plates=allowed))
+    await update.effective_chat.send_message(t(_resolve_lang(update, context), "choose_start"), reply_markup=build_plate_keyboard("start", allowed_plates=allowed))
 
 async def end_trip_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -2349,7 +2594,7 @@ async def end_trip_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     allowed = None
     if user and user.username and driver_map.get(user.username):
         allowed = driver_map.get(user.username)
-    await update.effective_chat.send_message(t(context.user_data.get("lang", DEFAULT_LANG), "choose_end"), reply_markup=build_plate_keyboard("end", allowed_plates=allowed))
+    await update.effective_chat.send_message(t(_resolve_lang(update, context), "choose_end"), reply_markup=build_plate_keyboard("end", allowed_plates=allowed))
 
 async def mission_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -2362,7 +2607,7 @@ async def mission_start_command(update: Update, context: ContextTypes.DEFAULT_TY
     allowed = None
     if user and user.username and driver_map.get(user.username):
         allowed = driver_map.get(user.username)
-    await update.effective_chat.send_message(t(context.user_data.get("lang", DEFAULT_LANG), "mission_start_prompt_plate"), reply_markup=build_plate_keyboard("mission_start_plate", allowed_plates=allowed))
+    await update.effective_chat.send_message(t(_resolve_lang(update, context), "mission_start_prompt_plate"), reply_markup=build_plate_keyboard("mission_start_plate", allowed_plates=allowed))
 
 async def mission_end_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -2375,7 +2620,7 @@ async def mission_end_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     allowed = None
     if user and user.username and driver_map.get(user.username):
         allowed = driver_map.get(user.username)
-    await update.effective_chat.send_message(t(context.user_data.get("lang", DEFAULT_LANG), "mission_end_prompt_plate"), reply_markup=build_plate_keyboard("mission_end_plate", allowed_plates=allowed))
+    await update.effective_chat.send_message(t(_resolve_lang(update, context), "mission_end_prompt_plate"), reply_markup=build_plate_keyboard("mission_end_plate", allowed_plates=allowed))
 
 async def leave_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -2482,7 +2727,7 @@ async def process_force_reply(update: Update, context: ContextTypes.DEFAULT_TYPE
                         except Exception:
                             pass
                         try:
-                            await context.bot.send_message(chat_id=user.id, text=t(context.user_data.get("lang", DEFAULT_LANG), "invalid_odo"))
+                            await context.bot.send_message(chat_id=user.id, text=t(_resolve_lang(update, context), "invalid_odo"))
                         except Exception:
                             pass
                         try:
@@ -2525,7 +2770,7 @@ async def process_force_reply(update: Update, context: ContextTypes.DEFAULT_TYPE
                         except Exception:
                             pass
                         try:
-                            await context.bot.send_message(chat_id=user.id, text=t(context.user_data.get("lang", DEFAULT_LANG), "invalid_amount"))
+                            await context.bot.send_message(chat_id=user.id, text=t(_resolve_lang(update, context), "invalid_amount"))
                         except Exception:
                             pass
                         try:
@@ -2604,7 +2849,7 @@ async def process_force_reply(update: Update, context: ContextTypes.DEFAULT_TYPE
                     except Exception:
                         pass
                     try:
-                        await context.bot.send_message(chat_id=user.id, text=t(context.user_data.get("lang", DEFAULT_LANG), "invalid_odo"))
+                        await context.bot.send_message(chat_id=user.id, text=t(_resolve_lang(update, context), "invalid_odo"))
                     except Exception:
                         pass
                     try:
@@ -2655,7 +2900,7 @@ async def process_force_reply(update: Update, context: ContextTypes.DEFAULT_TYPE
                     except Exception:
                         pass
                     try:
-                        await context.bot.send_message(chat_id=user.id, text=t(context.user_data.get("lang", DEFAULT_LANG), "invalid_amount"))
+                        await context.bot.send_message(chat_id=user.id, text=t(_resolve_lang(update, context), "invalid_amount"))
                     except Exception:
                         pass
                     try:
@@ -3014,6 +3259,177 @@ async def process_force_reply(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def location_or_staff(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return await process_force_reply(update, context)
 
+async def _post_mission_summary(context, q, driver: str, plate: str, user_lang: str):
+    """Background part of mission_end_now for a merged roundtrip.
+
+    Bumps/persists the mission cycle and sends the driver/plate summary
+    lines; scheduled after the arrival message so the button press
+    returns without waiting on the extra sheet reads and sends.
+    """
+    # ==== merged roundtrip handling (clean replacement) ====
+    # Ensure mission_cycle loaded
+    with suppress(Exception):
+        _ensure_mission_cycle_loaded(context.chat_data)
+    key_cycle = f"mission_cycle|{driver}|{plate}"
+    cur_cycle = context.chat_data.get("mission_cycle", {}).get(key_cycle, 0) + 1
+    context.chat_data.setdefault("mission_cycle", {})[key_cycle] = cur_cycle
+    logger.info("Mission cycle for %s now %d", key_cycle, cur_cycle)
+    # persist via debounced write-behind (best-effort)
+    try:
+        schedule_mission_cycles_save(context.chat_data.get("mission_cycle", {}))
+    except Exception:
+        _safe_log_exception("Failed to persist mission_cycle after update")
+    # A merged roundtrip was just detected -> compute and send summary immediately
+    # roundtrip is complete (outbound + return)
+    try:
+        nowdt = _now_dt()
+        # Sheet reads run in a worker thread; only the sends below stay on the event loop.
+        c = await asyncio.to_thread(_mission_summary_counts, driver, plate, nowdt)
+        month_label = c["month_start"].strftime('%B')
+        line1 = t(user_lang, 'roundtrip_merged_notify', driver=driver, d_month=c["d_month"], month=month_label, d_year=c["d_year"], year=nowdt.year, plate=plate, p_month=c["p_month"], p_year=c["p_year"])
+        line2 = (f"🚹Driver {driver} has {c['driver_mission_days']} mission day(s) "f"in {month_label} {nowdt.year}.")
+        line3 = (f"🚘{plate} completed {c['plate_mission_count']} mission(s) "f"in {month_label} {nowdt.year}.")
+        try:
+            if line1 and line1.strip():
+                await q.message.chat.send_message(line1)
+            await q.message.chat.send_message(line2)
+            await q.message.chat.send_message(line3)
+        except Exception as e:
+            logger.exception(f"Failed to send merged roundtrip summary: {e}")
+        # record sent time and reset cycle counter
+        try:
+            last_map = context.chat_data.get("last_merge_sent", {})
+            last_map[f"{driver}|{plate}"] = nowdt.isoformat()
+            context.chat_data["last_merge_sent"] = last_map
+            context.chat_data["mission_cycle"][key_cycle] = 0
+            try:
+                schedule_mission_cycles_save(context.chat_data.get("mission_cycle", {}))
+            except Exception:
+                _safe_log_exception("Failed to persist mission_cycle after reset")
+        except Exception:
+            _safe_log_exception("Failed to persist last_merge_sent timestamp or reset cycle")
+    except Exception:
+        _safe_log_exception("Failed preparing merged roundtrip summary.")
+
+def _mission_summary_counts(driver: str, plate: str, nowdt: datetime) -> Dict[str, Any]:
+    """Blocking sheet reads behind _post_mission_summary; call via asyncio.to_thread."""
+    month_start = datetime(nowdt.year, nowdt.month, 1)
+    if nowdt.month == 12:
+        month_end = datetime(nowdt.year + 1, 1, 1)
+    else:
+        month_end = datetime(nowdt.year, nowdt.month + 1, 1)
+    counts = count_roundtrips_per_driver_month(month_start, month_end)
+    d_month = counts.get(driver, 0)
+    year_start = datetime(nowdt.year, 1, 1)
+    year_end = datetime(nowdt.year + 1, 1, 1)
+    counts_year = count_roundtrips_per_driver_month(year_start, year_end)
+    d_year = counts_year.get(driver, 0)
+
+    # One Missions read serves the plate roundtrip counts and the month totals.
+    rows = open_worksheet(MISSIONS_TAB).get_all_values()
+
+    plate_counts_month = 0
+    plate_counts_year = 0
+    try:
+        vals_all, sidx = _missions_split_header(rows)
+        target_plate = str(plate).strip()
+        for r in vals_all[sidx:]:
+            # _ensure_row_length pads to M_MANDATORY_COLS, so no bounds checks needed
+            r = _ensure_row_length(r, M_MANDATORY_COLS)
+            rpl, rrt, rstart = (
+                r[M_IDX_PLATE].strip(),
+                r[M_IDX_ROUNDTRIP].strip().lower(),
+                r[M_IDX_START].strip(),
+            )
+            if not rpl or rpl != target_plate or rrt != "yes":
+                continue
+            sdt = parse_ts(rstart)
+            if not sdt:
+                continue
+            if month_start <= sdt < month_end:
+                plate_counts_month += 1
+            if year_start <= sdt < year_end:
+                plate_counts_year += 1
+    except Exception:
+        _safe_log_exception("Failed to compute plate roundtrip counts")
+
+    # 跳过表头
+    data_rows = rows[1:]
+    # === 统计 Driver 本月 Mission Days（直接用 M 列）===
+    driver_mission_days = 0
+
+    for r in data_rows:
+        # 防止列不够导致崩溃
+        if len(r) <= M_IDX_MISSION_DAYS:
+            continue
+
+        name = str(r[M_IDX_NAME]).strip()
+        start_raw = str(r[M_IDX_START]).strip()
+
+        # 只算当前司机
+        if name != driver or not start_raw:
+            continue
+
+        start_dt = parse_ts(start_raw)
+        if not start_dt:
+            continue
+
+        # 只算当月
+        if not (month_start <= start_dt < month_end):
+            continue
+
+        with suppress(Exception):
+            driver_mission_days += int(r[M_IDX_MISSION_DAYS] or 0)
+
+    # === 统计 Plate 本月 Mission 次数（按 Missions 行数）===
+    plate_mission_count = 0
+
+    for r in data_rows:
+        if len(r) <= M_IDX_PLATE:
+            continue
+
+        name = str(r[M_IDX_NAME]).strip()
+        plate_val = str(r[M_IDX_PLATE]).strip()
+        start_raw = str(r[M_IDX_START]).strip()
+
+        if name != driver or plate_val != plate or not start_raw:
+            continue
+
+        start_dt = parse_ts(start_raw)
+        if not start_dt:
+            continue
+
+        if not (month_start <= start_dt < month_end):
+            continue
+
+        plate_mission_count += 1
+
+    return {
+        "month_start": month_start,
+        "d_month": d_month,
+        "d_year": d_year,
+        "p_month": plate_counts_month,
+        "p_year": plate_counts_year,
+        "driver_mission_days": driver_mission_days,
+        "plate_mission_count": plate_mission_count,
+    }
+
+
+# Static callback routes for plate_callback, built once at import time.
+# callback_data -> (TR key for the prompt, build_plate_keyboard prefix or None)
+_PLATE_MENU_ROUTES = {
+    "show_start": ("choose_start", "start"),
+    "show_end": ("choose_end", "end"),
+    "show_mission_start": ("mission_start_prompt_plate", "mission_start_plate"),
+    "show_mission_end": ("mission_end_prompt_plate", "mission_end_plate"),
+    "help": ("help", None),
+}
+
+# "<prefix>|..." callbacks handed off wholesale to another handler
+_PLATE_CALLBACK_DELEGATES = {
+    "fin_type": admin_fin_type_selected,
+}
+
 async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     if not q:
@@ -3043,22 +3459,13 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         driver = ""
 
-    user_lang = context.user_data.get("lang", DEFAULT_LANG)
+    user_lang = _resolve_lang(update, context)
 
-    if data == "show_start":
-        await q.edit_message_text(t(user_lang, "choose_start"), reply_markup=build_plate_keyboard("start"))
-        return
-    if data == "show_end":
-        await q.edit_message_text(t(user_lang, "choose_end"), reply_markup=build_plate_keyboard("end"))
-        return
-    if data == "show_mission_start":
-        await q.edit_message_text(t(user_lang, "mission_start_prompt_plate"), reply_markup=build_plate_keyboard("mission_start_plate"))
-        return
-    if data == "show_mission_end":
-        await q.edit_message_text(t(user_lang, "mission_end_prompt_plate"), reply_markup=build_plate_keyboard("mission_end_plate"))
-        return
-    if data == "help":
-        await q.edit_message_text(t(user_lang, "help"))
+    menu_route = _PLATE_MENU_ROUTES.get(data)
+    if menu_route:
+        text_key, kb_prefix = menu_route
+        markup = build_plate_keyboard(kb_prefix) if kb_prefix else None
+        await q.edit_message_text(t(user_lang, text_key), reply_markup=markup)
         return
 
     if data == "admin_finance":
@@ -3066,8 +3473,11 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await q.edit_message_text("❌ Admins only.")
             return
         return await admin_finance_callback_handler(update, context)
-    if data.startswith("fin_type|"):
-        return await admin_fin_type_selected(update, context)
+
+    prefix, sep, _ = data.partition("|")
+    delegate = _PLATE_CALLBACK_DELEGATES.get(prefix) if sep else None
+    if delegate:
+        return await delegate(update, context)
 
     if data.startswith("fin_plate|"):
         parts = data.split("|", 2)
@@ -3101,11 +3511,9 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Mark leave pending and edit the callback message to a short prompt (avoid duplicate long messages)
         try:
             context.user_data["pending_leave"] = {"prompt_chat": q.message.chat.id, "prompt_msg_id": q.message.message_id, "origin": {"chat": q.message.chat.id, "msg_id": q.message.message_id}}
-            user_lang = context.user_data.get("lang", DEFAULT_LANG)
-            try:
+            user_lang = _resolve_lang(update, context)
+            with suppress(Exception):
                 await q.edit_message_text(t(user_lang, "leave_pending"))
-            except Exception:
-                pass
         except Exception:
             logger.exception("Failed to prompt leave.")
         return
@@ -3195,15 +3603,16 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             vals, start_idx = _missions_get_values_and_data_rows(ws)
             found_idx = None
             found_dep = None
-            for i in range(len(vals) - 1, start_idx - 1, -1):
-                r = _ensure_row_length(vals[i], M_MANDATORY_COLS)
-                rn = str(r[M_IDX_NAME]).strip()
-                rp = str(r[M_IDX_PLATE]).strip()
-                rend = str(r[M_IDX_END]).strip()
-                dep = str(r[M_IDX_DEPART]).strip()
-                if rn == driver and rp == plate and not rend:
-                    found_idx = i
-                    found_dep = dep
+            last_idx = len(vals) - 1
+            for off, r in enumerate(reversed(vals[start_idx:])):
+                r = _ensure_row_length(r, M_MANDATORY_COLS)
+                if (
+                    r[M_IDX_NAME].strip() == driver
+                    and r[M_IDX_PLATE].strip() == plate
+                    and not r[M_IDX_END].strip()
+                ):
+                    found_idx = last_idx - off
+                    found_dep = r[M_IDX_DEPART].strip()
                     break
             if found_idx is None:
                 await q.edit_message_text(t(user_lang, "mission_no_open", plate=plate))
@@ -3230,201 +3639,15 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             # If merged roundtrip, send summary (uses roundtrip_merged_notify template)
             if res.get("merged"):
-                # ==== merged roundtrip handling (clean replacement) ====
-                # Ensure mission_cycle loaded
-                try:
-                    _ensure_mission_cycle_loaded(context.chat_data)
-                except Exception:
-                    pass
-                key_cycle = f"mission_cycle|{driver}|{plate}"
-                cur_cycle = context.chat_data.get("mission_cycle", {}).get(key_cycle, 0) + 1
-                context.chat_data.setdefault("mission_cycle", {})[key_cycle] = cur_cycle
-                logger.info("Mission cycle for %s now %d", key_cycle, cur_cycle)
-                # persist immediately (best-effort)
-                try:
-                    save_mission_cycles_to_sheet(context.chat_data.get("mission_cycle", {}))
-                except Exception:
-                    try:
-                        logger.exception("Failed to persist mission_cycle after update")
-                    except Exception:
-                        pass
-                # A merged roundtrip was just detected -> compute and send summary immediately
-                # roundtrip is complete (outbound + return)
-                try:
-                    nowdt = _now_dt()
-                    month_start = datetime(nowdt.year, nowdt.month, 1)
-                    if nowdt.month == 12:
-                        month_end = datetime(nowdt.year + 1, 1, 1)
-                    else:
-                        month_end = datetime(nowdt.year, nowdt.month + 1, 1)
-                    counts = count_roundtrips_per_driver_month(month_start, month_end)
-                    d_month = counts.get(driver, 0)
-                    year_start = datetime(nowdt.year, 1, 1)
-                    counts_year = count_roundtrips_per_driver_month(year_start, datetime(nowdt.year + 1, 1, 1))
-                    d_year = counts_year.get(driver, 0)
-                    plate_counts_month = 0
-                    plate_counts_year = 0
-                    try:
-                        vals_all, sidx = _missions_get_values_and_data_rows(open_worksheet(MISSIONS_TAB))
-                        target_plate = str(plate).strip()
-                        year_end = datetime(nowdt.year + 1, 1, 1)
-                        for r in vals_all[sidx:]:
-                            r = _ensure_row_length(r, M_MANDATORY_COLS)
-                            rpl = str(r[M_IDX_PLATE]).strip() if len(r) > M_IDX_PLATE else ""
-                            rrt = str(r[M_IDX_ROUNDTRIP]).strip().lower() if len(r) > M_IDX_ROUNDTRIP else ""
-                            rstart = str(r[M_IDX_START]).strip() if len(r) > M_IDX_START else ""
-                            if not rpl or rpl != target_plate or rrt != "yes":
-                                continue
-                            sdt = parse_ts(rstart)
-                            if not sdt:
-                                continue
-                            if month_start <= sdt < month_end:
-                                plate_counts_month += 1
-                            if year_start <= sdt < year_end:
-                                plate_counts_year += 1
-                    except Exception:
-                        try:
-                            logger.exception("Failed to compute plate roundtrip counts")
-                        except Exception:
-                            pass
-                    month_label = month_start.strftime("%B")
-                    msg = t(user_lang, "roundtrip_merged_notify", driver=driver, d_month=d_month, month=month_label, d_year=d_year, year=nowdt.year, plate=plate, p_month=plate_counts_month, p_year=plate_counts_year)
-                    
-                    try:
-                        md_month = 0
-                        md_today = 0
-                        today_dt = nowdt.date()
-                        try:
-                            vals_all, sidx = _missions_get_values_and_data_rows(open_worksheet(MISSIONS_TAB))
-                            for r in vals_all[sidx:]:
-                                r = _ensure_row_length(r, M_MANDATORY_COLS)
-                                ruser = str(r[M_IDX_NAME]).strip() if len(r) > M_IDX_NAME else ''
-                                if not ruser or ruser != driver:
-                                    continue
-                                rstart = parse_ts(str(r[M_IDX_START]).strip()) if len(r) > M_IDX_START else None
-                                rend = parse_ts(str(r[M_IDX_END]).strip()) if len(r) > M_IDX_END else None
-                                if not rstart or not rend:
-                                    continue
-                                m_start = max(rstart.date(), month_start.date())
-                                m_end = min(rend.date(), (month_end - timedelta(days=1)).date())
-                                if m_start <= m_end:
-                                    md_month += (m_end - m_start).days + 1
-                                t_start = max(rstart.date(), today_dt)
-                                t_end = min(rend.date(), today_dt)
-                                if t_start <= t_end:
-                                    md_today += (t_end - t_start).days + 1
-                        except Exception:
-                            try:
-                                logger.exception('Failed to compute mission days for notification (safe)')
-                            except Exception:
-                                pass
-                        month_label = month_start.strftime('%B')
-                        line1 = t(user_lang, 'roundtrip_merged_notify', driver=driver, d_month=d_month, month=month_label, d_year=d_year, year=nowdt.year, plate=plate, p_month=plate_counts_month, p_year=plate_counts_year)
-                        # Build line2 and line3 explicitly
-                        # === Step 1: 读取 Missions 表 ===
-                        ws = open_worksheet(MISSIONS_TAB)
-                        rows = ws.get_all_values()
-
-                        # 跳过表头
-                        data_rows = rows[1:]
-                        # === Step 2: 统计 Driver 本月 Mission Days（直接用 M 列）===
-                        driver_mission_days = 0
-
-                        for r in data_rows:
-                            # 防止列不够导致崩溃
-                            if len(r) <= M_IDX_MISSION_DAYS:
-                                continue
-
-                            name = str(r[M_IDX_NAME]).strip()
-                            start_raw = str(r[M_IDX_START]).strip()
-
-                            # 只算当前司机
-                            if name != driver or not start_raw:
-                                continue
-
-                            start_dt = parse_ts(start_raw)
-                            if not start_dt:
-                                continue
-
-                            # 只算当月
-                            if not (month_start <= start_dt < month_end):
-                                continue
-
-                            try:
-                                driver_mission_days += int(r[M_IDX_MISSION_DAYS] or 0)
-                            except Exception:
-                                pass
-
-                        # === Step 3: 统计 Plate 本月 Mission 次数（按 Missions 行数）===
-                        plate_mission_count = 0
-
-                        for r in data_rows:
-                            if len(r) <= M_IDX_PLATE:
-                                continue
-
-                            name = str(r[M_IDX_NAME]).strip()
-                            plate_val = str(r[M_IDX_PLATE]).strip()
-                            start_raw = str(r[M_IDX_START]).strip()
-
-                            if name != driver or plate_val != plate or not start_raw:
-                                continue
-
-                            start_dt = parse_ts(start_raw)
-                            if not start_dt:
-                                continue
-
-                            if not (month_start <= start_dt < month_end):
-                                continue
-
-                            plate_mission_count += 1
-
-                        line2 = (f"🚹Driver {driver} has {driver_mission_days} mission day(s) "f"in {month_label} {nowdt.year}.")
-                        line3 = (f"🚘{plate} completed {plate_mission_count} mission(s) "f"in {month_label} {nowdt.year}.")
-                        try:
-                            if line1 and line1.strip():
-                                await q.message.chat.send_message(line1)
-                            else:
-                                summary_line1 = f"🛫Driver {driver} completed {d_month} mission(s) in {month_label} and {d_year} mission(s) in {nowdt.year}."
-                            await q.message.chat.send_message(line2)
-                            await q.message.chat.send_message(line3)
-                        except Exception as e:
-                            logger.exception(f"Failed to send merged roundtrip summary: {e}")
-                        # record sent time and reset cycle counter
-                        try:
-                            last_map = context.chat_data.get("last_merge_sent", {})
-                            last_map[f"{driver}|{plate}"] = nowdt.isoformat()
-                            context.chat_data["last_merge_sent"] = last_map
-                            context.chat_data["mission_cycle"][key_cycle] = 0
-                            try:
-                                save_mission_cycles_to_sheet(context.chat_data.get("mission_cycle", {}))
-                            except Exception:
-                                try:
-                                    logger.exception("Failed to persist mission_cycle after reset")
-                                except Exception:
-                                    pass
-                        except Exception:
-                            try:
-                                logger.exception("Failed to persist last_merge_sent timestamp or reset cycle")
-                            except Exception:
-                                pass
-                    except Exception:
-                        try:
-                            logger.exception("Failed to send merged roundtrip summary.")
-                        except Exception:
-                            pass
-                except Exception:
-                    try:
-                        logger.exception("Failed preparing merged roundtrip summary.")
-                    except Exception:
-                        pass
+                context.application.create_task(
+                    _post_mission_summary(context, q, driver, plate, user_lang)
+                )
+            return
 
     # ---------- end mission-related handlers ----------
 
         except Exception:
-            try:
-                logger.exception("Closed missing except for mission handler")
-            except Exception:
-                pass
+            _safe_log_exception("Closed missing except for mission handler")
             pass
     if data.startswith("start|") or data.startswith("end|"):
         try:
@@ -3449,10 +3672,8 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     except Exception:
                         pass
             else:
-                try:
+                with suppress(Exception):
                     await q.edit_message_text("❌ " + res.get("message", ""))
-                except Exception:
-                    pass
             return
         elif action == "end":
             res = record_end_trip(driver, plate)
@@ -3475,11 +3696,12 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 p_today = 0
                 p_month = 0
                 p_year = 0
+                today_d = nowdt.date()
                 try:
                     ws = open_worksheet(RECORDS_TAB)
                     vals = ws.get_all_values()
                     if vals:
-                        start_idx = 1 if any("date" in c.lower() for c in vals[0] if c) else 0
+                        start_idx = _records_start_idx(vals)
                         for r in vals[start_idx:]:
                             if len(r) < COL_START:
                                 continue
@@ -3494,12 +3716,16 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                             sdt = parse_ts(s_ts)
                             if not sdt:
                                 continue
-                            if sdt.date() == nowdt.date():
+                            # windows are nested (today ⊂ month ⊂ year): test the
+                            # outermost first so older rows skip the inner checks
+                            if not (year_start <= sdt < year_end):
+                                continue
+                            p_year += 1
+                            if not (month_start <= sdt < month_end):
+                                continue
+                            p_month += 1
+                            if sdt.date() == today_d:
                                 p_today += 1
-                            if month_start <= sdt < month_end:
-                                p_month += 1
-                            if year_start <= sdt < year_end:
-                                p_year += 1
                 except Exception:
                     logger.exception("Failed to compute plate trip counts")
                 try:
@@ -3516,10 +3742,8 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 except Exception:
                     logger.exception("Failed to send trip summary")
             else:
-                try:
+                with suppress(Exception):
                     await q.edit_message_text("❌ " + res.get("message", ""))
-                except Exception:
-                    pass
             return
 
 
@@ -3529,27 +3753,100 @@ async def plate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await q.edit_message_text(t(user_lang, "invalid_sel"))
 
-async def lang_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ensure_user_lang(update, context)
-    
-    msg = update.effective_message
-    args = context.args or []
+# Telegram allows ~20 messages/minute per group and ~30/second overall; pace below both.
+_TG_CHAT_MIN_INTERVAL = 60.0 / 20
+_TG_GLOBAL_MIN_INTERVAL = 1.0 / 28
+_TG_MESSAGE_LIMIT = 4000  # hard limit is 4096; leave headroom for formatting
+_tg_last_send_by_chat: Dict[str, float] = {}
+_tg_last_send_global = 0.0
+
+def _chunk_lines(lines: List[str], limit: int = _TG_MESSAGE_LIMIT) -> List[str]:
+    """Join lines into newline-separated messages no longer than limit characters."""
+    chunks: List[str] = []
+    cur: List[str] = []
+    size = 0
+    for line in lines:
+        while len(line) > limit:
+            if cur:
+                chunks.append("\n".join(cur))
+                cur, size = [], 0
+            chunks.append(line[:limit])
+            line = line[limit:]
+        extra = len(line) + (1 if cur else 0)
+        if cur and size + extra > limit:
+            chunks.append("\n".join(cur))
+            cur, size, extra = [], 0, len(line)
+        cur.append(line)
+        size += extra
+    if cur:
+        chunks.append("\n".join(cur))
+    return chunks
+
+async def _throttled_send(bot, chat_id, text: str, **kwargs):
+    """bot.send_message paced to stay under Telegram's per-chat and global flood limits.
+
+    Slots are reserved up front and the wait happens afterwards, so a chat that has to wait
+    for its own slot doesn't hold up sends to other chats. There is no await between reading
+    and reserving a slot, so the event loop needs no lock here.
+    """
+    global _tg_last_send_global
+    key = str(chat_id)
+    now = time.monotonic()
+    chat_ready = max(now, _tg_last_send_by_chat.get(key, 0.0) + _TG_CHAT_MIN_INTERVAL)
+    _tg_last_send_by_chat[key] = chat_ready
+    if chat_ready > now:
+        await asyncio.sleep(chat_ready - now)
+    # Global slot is taken only once this chat is due, so it never queues behind other chats' waits.
+    now = time.monotonic()
+    global_ready = max(now, _tg_last_send_global + _TG_GLOBAL_MIN_INTERVAL)
+    _tg_last_send_global = global_ready
+    if global_ready > now:
+        await asyncio.sleep(global_ready - now)
+    return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+
+async def _send_lines(bot, chat_id, lines: List[str], **kwargs):
+    for chunk in _chunk_lines(lines):
+        await _throttled_send(bot, chat_id, chunk, **kwargs)
+
+_REPORT_DEBOUNCE_SEC = 30.0
+# Legacy Bot_State key prefix for the marker below; such rows are skipped by _bot_state_refresh.
+_REPORT_SENT_PREFIX = "report_sent:"
+_REPORT_SENT_FILE = os.getenv("REPORT_SENT_FILE") or "startup_report_sent.json"
+
+def _load_report_markers() -> Dict[str, str]:
+    with suppress(Exception):
+        with open(_REPORT_SENT_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            return data
+    return {}
+
+def _save_report_marker(chat_id, marker: str) -> None:
+    data = _load_report_markers()
+    data[str(chat_id)] = marker
+    try:
+        with open(_REPORT_SENT_FILE, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+    except Exception:
+        logger.exception("Failed to write %s", _REPORT_SENT_FILE)
 
-    if not args:
-        await reply_private(update, context, "Usage: /lang en | km")
-        return
+async def _debounced_send_lines(bot, chat_id, lines: List[str], ttl: float = _REPORT_DEBOUNCE_SEC) -> bool:
+    """_send_lines, but drop a report identical to one sent to the same chat within ttl seconds.
 
-    lang = args[0].lower()
-    if lang not in ("en", "km"):
-        await reply_private(update, context, "Unsupported language. Use: en / km")
-        return
-
-    context.user_data["lang"] = lang
-
-    if lang == "en":
-        await reply_private(update, context, "Language set to English.")
-    else:
-        await reply_private(update, context, "បានកំណត់ភាសាជាភាសាខ្មែរ。")
+    Restart loops can fire the startup report back to back; this keeps them from eating into
+    the per-chat flood limit. The marker is kept in a local file (next to the persistence
+    pickle) so it survives the restart, and is only written after a successful send.
+    Returns False when the send was suppressed.
+    """
+    digest = hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+    prev = _load_report_markers().get(str(chat_id), "")
+    prev_digest, _, prev_ts = prev.partition("|")
+    with suppress(ValueError):
+        if prev_digest == digest and time.time() - float(prev_ts) < ttl:
+            return False
+    await _send_lines(bot, chat_id, lines)
+    _save_report_marker(chat_id, f"{digest}|{time.time():.0f}")
+    return True
 
 async def debug_bot_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -3560,47 +3857,65 @@ async def debug_bot_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         pass
     user = update.effective_user
-    bot_token = os.getenv("BOT_TOKEN")
-    sheet_id = os.getenv("SHEET_ID") or os.getenv("GOOGLE_SHEET_NAME") or ""
-    google_creds = bool(os.getenv("GOOGLE_CREDS_B64") or os.getenv("GOOGLE_CREDS_BASE64") or os.getenv("GOOGLE_CREDS_PATH"))
-    menu_chat = os.getenv("MENU_CHAT_ID") or os.getenv("SUMMARY_CHAT_ID") or ""
     lines = []
     lines.append("**Driver Bot - Debug Report**")
-    lines.append(f"Bot token present: {'Yes' if bot_token else 'No'}")
-    lines.append(f"SHEET_ID present: {'Yes' if sheet_id else 'No'}")
-    lines.append(f"Google creds present: {'Yes' if google_creds else 'No'}")
-    lines.append(f"MENU_CHAT_ID / SUMMARY_CHAT_ID: {menu_chat or '(not set)'}")
+    lines.append(f"Bot token present: {'Yes' if _ENV.bot_token else 'No'}")
+    lines.append(f"SHEET_ID present: {'Yes' if _ENV.sheet_id else 'No'}")
+    lines.append(f"Google creds present: {'Yes' if _ENV.creds else 'No'}")
+    lines.append(f"MENU_CHAT_ID / SUMMARY_CHAT_ID: {_ENV.menu_or_summary_chat or '(not set)'}")
     # Try to fetch current bot commands
     try:
-        if bot_token:
-            b = Bot(bot_token)
-            cmds = await b.get_my_commands()
-            if cmds:
-                lines.append("Registered bot commands:")
-                for c in cmds:
-                    lines.append(f" - /{c.command}: {c.description}")
-            else:
-                lines.append("Registered bot commands: (none)")
+        cmds = await context.bot.get_my_commands()
+        if cmds:
+            lines.append("Registered bot commands:")
+            for c in cmds:
+                lines.append(f" - /{c.command}: {c.description}")
+        else:
+            lines.append("Registered bot commands: (none)")
     except Exception as e:
         lines.append("Failed to fetch bot commands: " + str(e))
     # Basic feature checks (handlers presence cannot be introspected easily; we'll report config and tabs)
-    try:
-        tabs = list(HEADERS_BY_TAB.keys()) if 'HEADERS_BY_TAB' in globals() else []
-        lines.append("Known sheet tabs: " + (", ".join(tabs) if tabs else "(none)"))
-    except Exception:
-        pass
-    text = "\
-".join(lines)
+    lines.append("Known sheet tabs: " + (", ".join(HEADERS_BY_TAB) or "(none)"))
     # Send in chat (split if too long)
     try:
-        await update.effective_chat.send_message(text)
+        await _send_lines(context.bot, update.effective_chat.id, lines)
     except Exception:
         try:
-            await context.bot.send_message(chat_id=user.id, text=text)
+            await _send_lines(context.bot, user.id, lines)
         except Exception:
             pass
 
 AUTO_KEYWORD_PATTERN = r'(?i)\b(start|menu|start trip|end trip|trip|出车|还车|返程)\b'
+AUTO_KEYWORD_RE = re.compile(AUTO_KEYWORD_PATTERN)
+# Every alternative in AUTO_KEYWORD_PATTERN contains one of these, so a miss here means no match.
+_AUTO_KEYWORDS = ("start", "menu", "trip", "出车", "还车", "返程")
+
+class _AutoKeywordFilter(filters.MessageFilter):
+    """Plain search over message text; skips the match-data bookkeeping of filters.Regex."""
+
+    def filter(self, message) -> bool:
+        text = message.text
+        if not text:
+            return False
+        # casefold() mirrors the pattern's (?i) closely enough for a substring prefilter;
+        # the regex then confirms the word boundaries.
+        folded = text.casefold()
+        if not any(kw in folded for kw in _AUTO_KEYWORDS):
+            return False
+        return AUTO_KEYWORD_RE.search(text) is not None
+
+AUTO_KEYWORD_FILTER = _AutoKeywordFilter(name="AutoKeywordFilter")
+
+# Button labels are not localised, so the menus are built once and shared (markups are immutable).
+_AUTO_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Start trip", callback_data="show_start"), InlineKeyboardButton("End trip", callback_data="show_end")],
+    [InlineKeyboardButton("Open full menu", callback_data="menu_full")],
+])
+_SETUP_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Start trip", callback_data="show_start"), InlineKeyboardButton("End trip", callback_data="show_end")],
+    [InlineKeyboardButton("Mission start", callback_data="show_mission_start"), InlineKeyboardButton("Mission end", callback_data="show_mission_end")],
+    [InlineKeyboardButton("Admin Finance", callback_data="admin_finance"), InlineKeyboardButton("Leave", callback_data="leave_menu")],
+])
 
 async def auto_menu_listener(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat and update.effective_chat.type in ("group", "supergroup"):
@@ -3613,12 +3928,8 @@ async def auto_menu_listener(update: Update, context: ContextTypes.DEFAULT_TYPE)
             except Exception:
                 pass
             return
-        user_lang = context.user_data.get("lang", DEFAULT_LANG)
-        keyboard = [
-            [InlineKeyboardButton("Start trip", callback_data="show_start"), InlineKeyboardButton("End trip", callback_data="show_end")],
-            [InlineKeyboardButton("Open full menu", callback_data="menu_full")],
-        ]
-        await update.effective_chat.send_message(t(user_lang, "menu"), reply_markup=InlineKeyboardMarkup(keyboard))
+        user_lang = _resolve_lang(update, context)
+        await update.effective_chat.send_message(t(user_lang, "menu"), reply_markup=_AUTO_MENU_MARKUP)
 
 async def send_daily_summary_job(context: ContextTypes.DEFAULT_TYPE):
     job_data = context.job.data if hasattr(context.job, "data") else {}
@@ -3626,27 +3937,19 @@ async def send_daily_summary_job(context: ContextTypes.DEFAULT_TYPE):
     if not chat_id:
         logger.info("SUMMARY_CHAT_ID not set; skipping daily summary.")
         return
-    if SUMMARY_TZ and ZoneInfo:
-        try:
-            tz = ZoneInfo(SUMMARY_TZ)
-            now = datetime.now(tz)
-        except Exception:
-            now = _now_dt()
-    else:
-        now = _now_dt()
+    now = datetime.now(_SUMMARY_TZ) if _SUMMARY_TZ else _now_dt()
     yesterday = now.date() - timedelta(days=1)
     date_dt = datetime.combine(yesterday, dtime.min)
+    # Sheets reads below are blocking HTTP calls; keep them off the event loop.
+    if now.day == 1:
+        # Month rollup reads MISSIONS_TAB too; fetch both tabs in one request.
+        await asyncio.to_thread(_batch_fetch_tabs, [RECORDS_TAB, MISSIONS_TAB])
     try:
-        totals = aggregate_for_period(date_dt, date_dt + timedelta(days=1))
+        totals = await asyncio.to_thread(aggregate_for_period, date_dt, date_dt + timedelta(days=1))
         if not totals:
-            await context.bot.send_message(chat_id=chat_id, text=f"No records for {date_dt.strftime(DATE_FMT)}")
+            await _throttled_send(context.bot, chat_id, f"No records for {date_dt.strftime(DATE_FMT)}")
         else:
-            lines = []
-            for plate, minutes in sorted(totals.items()):
-                h = minutes // 60
-                m = minutes % 60
-                lines.append(f"{plate}: {h}h{m}m")
-            await context.bot.send_message(chat_id=chat_id, text="\n".join(lines))
+            await _send_lines(context.bot, chat_id, [f"{plate}: {minutes // 60}h{minutes % 60}m" for plate, minutes in sorted(totals.items())])
     except Exception:
         logger.exception("Failed to send daily summary.")
 
@@ -3655,45 +3958,67 @@ async def send_daily_summary_job(context: ContextTypes.DEFAULT_TYPE):
             first_of_this_month = datetime(now.year, now.month, 1)
             prev_month_end = first_of_this_month
             prev_month_start = (first_of_this_month - timedelta(days=1)).replace(day=1)
-            rows = mission_rows_for_period(prev_month_start, prev_month_end)
-            ok = write_mission_report_rows(rows, period_label=prev_month_start.strftime("%Y-%m"))
-            counts = count_roundtrips_per_driver_month(prev_month_start, prev_month_end)
+            rows, counts = await asyncio.to_thread(scan_missions_for_period, prev_month_start, prev_month_end)
+            ok = await asyncio.to_thread(write_mission_report_rows, rows, prev_month_start.strftime("%Y-%m"))
             if ok:
-                await context.bot.send_message(chat_id=chat_id, text=f"Auto-generated mission report for {prev_month_start.strftime('%Y-%m')}.")
+                await _throttled_send(context.bot, chat_id, f"Auto-generated mission report for {prev_month_start.strftime('%Y-%m')}.")
         except Exception:
             logger.exception("Failed to auto-generate monthly mission report on day 1.")
 
+_ASCII_DIGITS = "0123456789"
+
+def _duration_text_to_minutes(duration_text: str) -> int:
+    """Parse the "{h}h{m}m" strings written by compute_duration without a regex.
+
+    Same rules as the old DURATION_RE.match(r'(?:(\\d+)h)?(?:(\\d+)m)?'): anchored at the
+    start, optional "<digits>h" then optional "<digits>m", anything else counts as 0 minutes
+    (so "1h30" is 60, "30" and " 1h30m" are 0).
+    """
+    hours = mins = 0
+    rest = duration_text
+    n = len(rest) - len(rest.lstrip(_ASCII_DIGITS))
+    if n and rest[n:n + 1] == "h":
+        hours = int(rest[:n])
+        rest = rest[n + 1:]
+        n = len(rest) - len(rest.lstrip(_ASCII_DIGITS))
+    if n and rest[n:n + 1] == "m":
+        mins = int(rest[:n])
+    return hours * 60 + mins
+
+_AGGREGATE_OUT_OF_ORDER_GRACE = 100
+
 def aggregate_for_period(start_dt: datetime, end_dt: datetime) -> Dict[str, int]:
-    totals: Dict[str, int] = {}
+    totals: Dict[str, int] = defaultdict(int)
     try:
-        ws = open_worksheet(RECORDS_TAB)
-        vals = ws.get_all_values()
+        vals = _cached_values(RECORDS_TAB)
         if not vals:
-            return totals
-        start_idx = 1 if any("date" in c.lower() for c in vals[0] if c) else 0
-        for r in vals[start_idx:]:
+            return {}
+        start_idx = _records_start_idx(vals)
+        # COL_PLATE and COL_START precede COL_DURATION, so the length check covers all three.
+        p_idx, s_idx, d_idx = COL_PLATE - 1, COL_START - 1, COL_DURATION - 1
+        # Records are appended over time, so walk newest-first and stop once we are
+        # clearly past the window; the grace count tolerates a few late/out-of-order rows.
+        older_seen = 0
+        for r in reversed(vals[start_idx:]):
             if len(r) < COL_DURATION:
                 continue
-            plate = r[COL_PLATE - 1] if len(r) >= COL_PLATE else ""
-            start_ts = r[COL_START - 1] if len(r) >= COL_START else ""
+            start_ts = r[s_idx]
             if not start_ts:
                 continue
             s_dt = parse_ts(start_ts)
             if not s_dt:
                 continue
-            if not (start_dt <= s_dt < end_dt):
+            if s_dt < start_dt:
+                older_seen += 1
+                if older_seen > _AGGREGATE_OUT_OF_ORDER_GRACE:
+                    break
+                continue
+            if s_dt >= end_dt:
                 continue
-            duration_text = r[COL_DURATION - 1] if len(r) >= COL_DURATION else ""
-            minutes = 0
-            m = re.match(r'(?:(\d+)h)?(?:(\d+)m)?', duration_text)
-            if m:
-                hours = int(m.group(1)) if m.group(1) else 0
-                mins = int(m.group(2)) if m.group(2) else 0
-                minutes = hours * 60 + mins
-            totals[plate] = totals.get(plate, 0) + minutes
+            totals[r[p_idx]] += _duration_text_to_minutes(r[d_idx])
     except Exception:
         logger.exception("Failed to aggregate for period.")
-    return totals
+    return dict(totals)
 
 async def setup_menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -3701,13 +4026,8 @@ async def setup_menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.effective_chat.send_message("❌ Admins only.")
         return
     try:
-        user_lang = context.user_data.get("lang", DEFAULT_LANG)
-        keyboard = [
-            [InlineKeyboardButton("Start trip", callback_data="show_start"), InlineKeyboardButton("End trip", callback_data="show_end")],
-            [InlineKeyboardButton("Mission start", callback_data="show_mission_start"), InlineKeyboardButton("Mission end", callback_data="show_mission_end")],
-            [InlineKeyboardButton("Admin Finance", callback_data="admin_finance"), InlineKeyboardButton("Leave", callback_data="leave_menu")],
-        ]
-        sent = await update.effective_chat.send_message(t(user_lang, "menu"), reply_markup=InlineKeyboardMarkup(keyboard))
+        user_lang = _resolve_lang(update, context)
+        sent = await update.effective_chat.send_message(t(user_lang, "menu"), reply_markup=_SETUP_MENU_MARKUP)
         # pin removed per user request: do not pin the menu message
     except Exception:
         logger.exception("Failed to setup menu.")
@@ -3778,39 +4098,36 @@ async def mission_report_driver_callback(update: Update, context: ContextTypes.D
 
     period_label = start.strftime("%Y-%m")
 
-    rows = mission_rows_for_period(start, end)
-
-    out = io.StringIO()
-    writer = csv.writer(out)
-
-    # Header（8 列，含 Return）
-    writer.writerow(
-        ["Driver", "Plate", "Start", "End", "Mission days", "Departure", "Arrival", "Return"]
-    )
+    rows = await asyncio.to_thread(mission_rows_for_period, start, end)
 
     total_mission_days = 0
-    found = False
-
-    for r in rows:
-        if r[0] != driver:
-            continue
+    mine = [r for r in rows if r[0] == driver]
 
-        found = True
+    if not mine:
+        await context.bot.send_message(
+            chat_id=query.from_user.id,
+            text=f"❌ No missions for {driver} in this month."
+        )
+        return
 
+    for r in mine:
         # ✅ Mission days：字符串直接转 int 相加
         try:
             total_mission_days += int(str(r[4]).strip())
         except Exception:
             pass
 
-        writer.writerow(r)
+    # CSV is encoded straight into the upload buffer instead of building a str first.
+    bio = io.BytesIO()
+    out = io.TextIOWrapper(bio, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(out)
 
-    if not found:
-        await context.bot.send_message(
-            chat_id=query.from_user.id,
-            text=f"❌ No missions for {driver} in this month."
-        )
-        return
+    # Header（8 列，含 Return）
+    writer.writerow(
+        ["Driver", "Plate", "Start", "End", "Mission days", "Departure", "Arrival", "Return"]
+    )
+
+    writer.writerows(mine)
 
     # Period 行
     last_day = (end - timedelta(days=1)).day
@@ -3832,7 +4149,8 @@ async def mission_report_driver_callback(update: Update, context: ContextTypes.D
         ]
     )
 
-    bio = io.BytesIO(out.getvalue().encode("utf-8"))
+    out.detach()  # flush and release bio, which the wrapper would otherwise close
+    bio.seek(0)
     bio.name = f"Mission_Report_{driver}_{period_label}.csv"
 
     await context.bot.send_document(
@@ -3860,16 +4178,19 @@ def register_ui_handlers(application):
     # Clock In/Out buttons handler
     application.add_handler(MessageHandler(filters.REPLY & filters.TEXT & (~filters.COMMAND), process_force_reply))
     application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), location_or_staff))
-    application.add_handler(MessageHandler(filters.Regex(AUTO_KEYWORD_PATTERN) & filters.ChatType.GROUPS, auto_menu_listener))
+    application.add_handler(MessageHandler(AUTO_KEYWORD_FILTER & filters.ChatType.GROUPS, auto_menu_listener))
     application.add_handler(MessageHandler(filters.COMMAND, delete_command_message), group=1)
-    application.add_handler(CommandHandler("help", lambda u, c: u.message.reply_text(t(c.user_data.get("lang", DEFAULT_LANG), "help"))))
+    application.add_handler(CommandHandler("help", lambda u, c: u.message.reply_text(t(_resolve_lang(u, c), "help"))))
     
     # Debug command for runtime self-check
     application.add_handler(CommandHandler('debug_bot', debug_bot_command))
-    application.add_handler(CallbackQueryHandler(plate_callback))
-    async def _set_cmds():
+    # Telegram keeps one command list per scope, so every command is published in this
+    # single call rather than several set_my_commands calls overwriting each other.
+    async def _set_cmds(app):
         try:
-            await application.bot.set_my_commands([
+            await app.bot.set_my_commands([
+                BotCommand("start", "Start the bot"),
+                BotCommand("help", "Show help"),
                 BotCommand("start_trip", "Start a trip (select plate)"),
                 BotCommand("end_trip", "End a trip (select plate)"),
                 BotCommand("menu", "Open trip menu"),
@@ -3877,24 +4198,30 @@ def register_ui_handlers(application):
                 BotCommand("mission_report", "Generate mission report: /mission_report month YYYY-MM"),
                 BotCommand("leave", "Record leave (admin)"),
                 BotCommand("setup_menu", "Post and pin the main menu (admins only)"),
+                BotCommand("setlang", "Set your language (en/km)"),
+                BotCommand("mylang", "Show your current language"),
+                BotCommand("forcelang", "Admin: force language for a user"),
             ])
         except Exception:
             logger.exception("Failed to set bot commands.")
 
+    # Chain onto any post_init set by the builder (safe_post_init) so PTB runs both once at startup.
+    prev_post_init = application.post_init
+
+    async def _post_init(app):
+        if prev_post_init:
+            await prev_post_init(app)
+        await _set_cmds(app)
+
+    application.post_init = _post_init
+
 async def safe_post_init(application):
     """
     Startup initialization that MUST NOT crash the app
     if Telegram API is temporarily unreachable.
     """
 
-    try:
-        await application.bot.set_my_commands([
-            BotCommand("start", "Start the bot"),
-            BotCommand("help", "Show help"),
-        ])
-    except Exception as e:
-        logger.warning("Startup: failed to set bot commands: %s", e)
-
+    # The command list itself is published once by _set_cmds (see register_ui_handlers).
     try:
         me = await application.bot.get_me()
         logger.info("Bot connected as @%s (%s)", me.username, me.id)
@@ -3905,17 +4232,17 @@ async def safe_post_init(application):
         await _send_startup_debug(application)
     except Exception as e:
         logger.warning("Startup: debug report failed: %s", e)
-def _delete_telegram_webhook(token: str) -> bool:
+async def _delete_telegram_webhook(token: str) -> bool:
     try:
         url = f"https://api.telegram.org/bot{token}/deleteWebhook"
-        req = urllib.request.Request(url, method="POST")
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = resp.read().decode("utf-8", errors="ignore")
-            if '"ok":true' in data or '"ok": true' in data:
-                logger.info("deleteWebhook succeeded or webhook not present.")
-                return True
+        async with httpx.AsyncClient(timeout=10) as client:
+            resp = await client.post(url)
+        data = resp.json()
+        if data.get("ok"):
+            logger.info("deleteWebhook succeeded or webhook not present.")
+        else:
             logger.info("deleteWebhook response: %s", data)
-            return True
+        return True
     except Exception as e:
         logger.exception("Failed to call deleteWebhook: %s", e)
         return False
@@ -3924,35 +4251,27 @@ async def _send_startup_debug(application):
     """
     Send startup debug report to MENU_CHAT_ID or SUMMARY_CHAT_ID if configured.
     """
-    chat_id = os.getenv("MENU_CHAT_ID") or os.getenv("SUMMARY_CHAT_ID")
+    chat_id = _ENV.menu_or_summary_chat
     if not chat_id:
         return
-    try:
-        bot_token = os.getenv("BOT_TOKEN")
-        lines = []
-        lines.append("Driver Bot startup debug report:")
-        lines.append(f"Bot token present: {'Yes' if bot_token else 'No'}")
-        lines.append(
-            f"SHEET_ID present: {'Yes' if (os.getenv('SHEET_ID') or os.getenv('GOOGLE_SHEET_NAME')) else 'No'}"
-        )
-        lines.append(
-            f"Google creds present: {'Yes' if (os.getenv('GOOGLE_CREDS_B64') or os.getenv('GOOGLE_CREDS_BASE64') or os.getenv('GOOGLE_CREDS_PATH')) else 'No'}"
-        )
+    lines = []
+    lines.append("Driver Bot startup debug report:")
+    lines.append(f"Bot token present: {'Yes' if _ENV.bot_token else 'No'}")
+    lines.append(f"SHEET_ID present: {'Yes' if _ENV.sheet_id else 'No'}")
+    lines.append(f"Google creds present: {'Yes' if _ENV.creds else 'No'}")
 
-        # list commands
-        try:
-            cmds = await application.bot.get_my_commands()
-            if cmds:
-                lines.append("Registered commands:")
-                for c in cmds:
-                    lines.append(f" - /{c.command}: {c.description}")
-        except Exception as e:
-            lines.append("Failed to fetch commands: " + str(e))
+    # list commands
+    try:
+        cmds = await application.bot.get_my_commands()
+        if cmds:
+            lines.append("Registered commands:")
+            for c in cmds:
+                lines.append(f" - /{c.command}: {c.description}")
+    except Exception as e:
+        lines.append("Failed to fetch commands: " + str(e))
 
-        text = "\n".join(lines)
-        await application.bot.send_message(chat_id=chat_id, text=text)
-    except Exception:
-        pass
+    with suppress(Exception):
+        await _debounced_send_lines(application.bot, chat_id, lines)
 
 # ===============================
 # REPORT HANDLER SELF-CHECK (LTS)
@@ -3994,8 +4313,19 @@ async def global_error_handler(update, context):
 
 
 def schedule_daily_summary(application):
-    """Schedule daily summary (no-op placeholder)."""
-    return
+    """Schedule send_daily_summary_job on PTB's JobQueue at SUMMARY_HOUR (SUMMARY_TZ)."""
+    if not SUMMARY_CHAT_ID:
+        return
+    jq = application.job_queue
+    if jq is None:
+        logger.info("JobQueue unavailable (python-telegram-bot[job-queue] not installed); daily summary not scheduled.")
+        return
+    jq.run_daily(
+        send_daily_summary_job,
+        time=dtime(hour=SUMMARY_HOUR, tzinfo=_SUMMARY_TZ),
+        data={"chat_id": SUMMARY_CHAT_ID},
+        name="daily_summary",
+    )
 
 def check_deployment_requirements():
     """Deployment requirements check (no-op placeholder)."""
@@ -4015,11 +4345,13 @@ def build_application(persistence):
         .request(request)
         .persistence(persistence)
         .post_init(safe_post_init)
+        .post_shutdown(flush_mission_cycles_on_shutdown)
         .build()
     )
 
     # register handlers
     register_ui_handlers(application)
+    register_all_handlers(application)
     schedule_daily_summary(application)
 
     # error handler
@@ -4032,6 +4364,15 @@ def main():
     ensure_env()
     check_deployment_requirements()
 
+    # --- Event loop (optional uvloop) ---
+    # Must run before any loop is created so both polling and webhook modes pick it up.
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop policy.")
+    except ImportError:
+        pass
+
     # --- Timezone sanity check ---
     if LOCAL_TZ and ZoneInfo:
         try:
@@ -4048,6 +4389,9 @@ def main():
     except Exception:
         persistence = None
 
+    # --- Warm language caches (helpers live in the MULTILANG section below) ---
+    _preload_lang_caches()
+
     IS_RAILWAY = bool(os.getenv("RAILWAY_ENVIRONMENT"))
     PORT = int(os.getenv("PORT", "8080"))
 
@@ -4071,6 +4415,11 @@ def main():
             port=PORT,
             url_path=WEBHOOK_PATH,
             webhook_url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            # run_webhook() calls setWebhook itself; Telegram then pushes only the update
+            # types we handle, checked against WEBHOOK_SECRET when it is set.
+            allowed_updates=[Update.MESSAGE, Update.CALLBACK_QUERY],
+            max_connections=int(os.getenv("WEBHOOK_MAX_CONN", "40")),
+            secret_token=os.getenv("WEBHOOK_SECRET") or None,
             stop_signals=None,
         )
 
@@ -4079,17 +4428,22 @@ def main():
         logger.info("Starting driver-bot in LOCAL polling mode")
 
         try:
-            _delete_telegram_webhook(BOT_TOKEN)
+            # Run on the loop run_polling() will pick up, rather than a throwaway one.
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(_delete_telegram_webhook(BOT_TOKEN))
         except Exception:
             logger.warning("Failed to delete webhook; continuing polling")
 
         application = build_application(persistence)
-        application.run_polling()
-
-
-if __name__ == "__main__":
-    main()
-
+        # Long-poll: getUpdates waits server-side, and only update types we handle are sent.
+        application.run_polling(
+            poll_interval=0.0,
+            timeout=30,
+            bootstrap_retries=-1,
+            drop_pending_updates=False,
+            allowed_updates=[Update.MESSAGE, Update.CALLBACK_QUERY],
+        )
 
 
 # === BEGIN: OT Summary integration (added) ===
@@ -4105,7 +4459,12 @@ def compute_window_for_time(now_dt: Optional[datetime] = None):
     year = now_dt.year
     month = now_dt.month
     candidate_start = datetime(year, month, 16, 0, 0, 0)
-    if now_dt < (candidate_start + timedelta(hours=4)):
+    return _ot_window(year, month, now_dt < (candidate_start + timedelta(hours=4)))
+
+@lru_cache(maxsize=8)
+def _ot_window(year: int, month: int, before_cutoff: bool):
+    # The window only changes at the 16th 04:00 cutoff, so memoize on (year, month, side).
+    if before_cutoff:
         # use previous month
         if month == 1:
             prev_month = 12
@@ -4115,7 +4474,7 @@ def compute_window_for_time(now_dt: Optional[datetime] = None):
             prev_year = year
         window_start = datetime(prev_year, prev_month, 16, 0, 0, 0)
     else:
-        window_start = candidate_start
+        window_start = datetime(year, month, 16, 0, 0, 0)
     # window_end is 15th of next month 23:59:59
     if window_start.month == 12:
         next_month = 1
@@ -4132,56 +4491,64 @@ def _collect_ot_records_in_window(window_start: datetime, window_end: datetime):
         ws = open_worksheet(OT_TAB)
         vals = ws.get_all_values()
     except Exception:
-        try:
-            logger.exception("Failed to open OT_TAB for OT summary collection")
-        except Exception:
-            pass
+        _safe_log_exception("Failed to open OT_TAB for OT summary collection")
         return []
     out = []
     if not vals or len(vals) <= 1:
         return out
+    # TS_FMT strings are fixed-width and zero-padded, so they order the same as the datetimes
+    # they encode: filter on the raw cell text and only parse rows inside the window.
+    lo = window_start.strftime(TS_FMT)
+    hi = window_end.strftime(TS_FMT)
+    ts_len = len(lo)
+    drv_i, ts_i, act_i = O_IDX_DRIVER, O_IDX_TIME, O_IDX_ACTION
     for row in vals[1:]:
-        try:
-            drv = row[O_IDX_DRIVER] if len(row) > O_IDX_DRIVER else ""
-            ts_s = row[O_IDX_TIME] if len(row) > O_IDX_TIME else ""
-            act = row[O_IDX_ACTION] if len(row) > O_IDX_ACTION else ""
-            if not ts_s:
-                continue
-            try:
-                ts = datetime.strptime(ts_s, "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                continue
-            if window_start <= ts <= window_end:
-                out.append({"driver": drv, "timestamp": ts, "event": act})
-        except Exception:
+        if len(row) <= ts_i:
+            continue
+        ts_s = row[ts_i]
+        if len(ts_s) != ts_len or not (lo <= ts_s <= hi):
+            continue
+        ts = parse_ts(ts_s)
+        if ts is None:
             continue
+        out.append({"driver": row[drv_i], "timestamp": ts, "event": row[act_i]})
     return out
 
 def compute_driver_ot_hours_from_records(records, window_start, window_end):
     """Aggregate simple worked-hours from IN/OUT pairs per driver within window (hours float)."""
-    drivers = {}
-    per = {}
+    # Flatten to parallel lists (whole seconds from window_start, 0=IN / 1=OUT / -1=other), sort
+    # one index list by (driver, time), then total every driver in a single integer sweep.
+    drvs, secs, codes = [], [], []
     for r in records:
-        d = r.get("driver") or "Unknown"
-        per.setdefault(d, []).append((r.get("timestamp"), r.get("event")))
+        ev = str(r.get("event") or "").upper().strip()
+        drvs.append(r.get("driver") or "Unknown")
+        secs.append(int((r.get("timestamp") - window_start).total_seconds()))
+        codes.append(0 if ev == "IN" else 1 if ev == "OUT" else -1)
+    order = sorted(range(len(drvs)), key=lambda i: (drvs[i], secs[i]))
+    end_sec = int((window_end - window_start).total_seconds())
     totals = {}
-    for drv, events in per.items():
-        events.sort(key=lambda x: x[0])
-        total = timedelta(0)
-        in_time = None
-        for ts, ev in events:
-            if ev and str(ev).upper().strip() == "IN":
-                in_time = ts
-            elif ev and str(ev).upper().strip() == "OUT":
-                if in_time:
-                    total += (ts - in_time)
-                    in_time = None
-                else:
-                    # OUT without IN - skip
-                    pass
-        if in_time:
-            total += (window_end - in_time)
-        totals[drv] = round(total.total_seconds() / 3600.0, 2)
+    cur = None
+    total = 0
+    in_sec = None
+    for i in order:
+        d = drvs[i]
+        if d != cur:
+            if cur is not None:
+                if in_sec is not None:
+                    total += end_sec - in_sec
+                totals[cur] = round(total / 3600.0, 2)
+            cur, total, in_sec = d, 0, None
+        code = codes[i]
+        if code == 0:
+            in_sec = secs[i]
+        elif code == 1 and in_sec is not None:
+            # OUT without IN is skipped
+            total += secs[i] - in_sec
+            in_sec = None
+    if cur is not None:
+        if in_sec is not None:
+            total += end_sec - in_sec
+        totals[cur] = round(total / 3600.0, 2)
     return totals
 
 def ensure_ot_summary_sheet_exists(spreadsheet):
@@ -4198,19 +4565,28 @@ def ensure_ot_summary_sheet_exists(spreadsheet):
             raise
     return ws
 
+_OT_SUMMARY_CLEAR_ROWS = 1000  # rows A1:D{n} rewritten on each update (previous body is blanked)
+
+def _ot_summary_sheet_ref() -> Tuple[str, str]:
+    """(name, key) of the OT Summary spreadsheet: sheet name env vars, then sheet id, then GOOGLE_SHEET_NAME."""
+    # prefer explicit sheet name env vars
+    sheet_name = os.getenv("GOOGLE_SHEET_NAME") or os.getenv("GOOGLE_SHEET_TAB") or ""
+    sheet_id = os.getenv("SHEET_ID") or os.getenv("SPREADSHEET_ID") or ""
+    if sheet_name:
+        return sheet_name, ""
+    if sheet_id:
+        return "", sheet_id
+    return GOOGLE_SHEET_NAME, ""
+
+def _get_cached_spreadsheet():
+    """Return the OT Summary spreadsheet through the shared handle cache."""
+    name, key = _ot_summary_sheet_ref()
+    return _open_spreadsheet_cached(name=name, key=key)
+
 def update_ot_summary_sheet(driver_totals: Dict[str, float], window_start: datetime, window_end: datetime):
     """Update or create OT Summary tab with totals. Uses existing gspread client helpers."""
     try:
-        gc = _get_gspread_client()
-        # prefer explicit sheet name env vars
-        sheet_name = os.getenv("GOOGLE_SHEET_NAME") or os.getenv("GOOGLE_SHEET_TAB") or None
-        sheet_id = os.getenv("SHEET_ID") or os.getenv("SPREADSHEET_ID") or None
-        if sheet_name:
-            sh = gc.open(sheet_name)
-        elif sheet_id:
-            sh = gc.open_by_key(sheet_id)
-        else:
-            sh = gc.open(GOOGLE_SHEET_NAME)
+        sh = _get_cached_spreadsheet()
         ws = None
         try:
             ws = sh.worksheet(os.getenv("OT_SUMMARY_TAB") or "OT Summary")
@@ -4220,35 +4596,23 @@ def update_ot_summary_sheet(driver_totals: Dict[str, float], window_start: datet
         rows = []
         for drv in sorted(driver_totals.keys(), key=lambda s: s or ""):
             rows.append([drv, round(driver_totals[drv], 2), window_start.isoformat(), window_end.isoformat()])
-        # clear existing body and write
+        # Header, rows and blank padding over the old body go out as one values update,
+        # replacing the separate header read, clear and write calls.
+        body = [["Driver", "Total OT Hours", "Window Start", "Window End"]] + rows
+        body += [["", "", "", ""]] * max(0, _OT_SUMMARY_CLEAR_ROWS - len(body))
+        rng = "A1:D{}".format(len(body))
         try:
-            # write header if missing
-            vals = ws.get_all_values()
-            if not vals or len(vals) == 0:
-                ws.append_row(["Driver", "Total OT Hours", "Window Start", "Window End"], value_input_option="USER_ENTERED")
-            # clear from A2:D1000 (best-effort)
-            try:
-                ws.batch_clear(["A2:D1000"])
-            except Exception:
-                pass
-            if rows:
-                ws.update("A2:D{}".format(len(rows)+1), rows, value_input_option="USER_ENTERED")
+            ws.update(rng, body, value_input_option="USER_ENTERED")
         except Exception:
-            # fallback: append rows
-            for r in rows:
-                try:
-                    ws.append_row(r, value_input_option="USER_ENTERED")
-                except Exception:
-                    try:
-                        ws.append_row(r)
-                    except Exception:
-                        pass
+            # one retry after a short backoff (e.g. transient 429/5xx)
+            time.sleep(2.0)
+            ws.update(rng, body, value_input_option="USER_ENTERED")
         return True
     except Exception as e:
-        try:
-            logger.exception("Failed to update OT Summary sheet: %s", e)
-        except Exception:
-            pass
+        # Drop the cached handle so the next update re-opens the spreadsheet.
+        name, key = _ot_summary_sheet_ref()
+        _main_sheet_cache.pop(name or "id:" + key, None)
+        _safe_log_exception("Failed to update OT Summary sheet: %s", e)
         return False
 
 async def ot_summary_summary_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -4262,20 +4626,20 @@ async def ot_summary_summary_command(update: Update, context: ContextTypes.DEFAU
             at = None
     now_dt = at or _now_dt()
     window_start, window_end = compute_window_for_time(now_dt)
-    # collect records from OT_TAB
-    recs = _collect_ot_records_in_window(window_start, window_end)
+    # collect records from OT_TAB (Sheets I/O runs in a worker thread to keep the loop responsive)
+    recs = await asyncio.to_thread(_collect_ot_records_in_window, window_start, window_end)
     driver_totals = compute_driver_ot_hours_from_records(recs, window_start, window_end)
     # attempt to update sheet (non-fatal)
     sheet_result = None
     try:
-        ok = update_ot_summary_sheet(driver_totals, window_start, window_end)
+        ok = await asyncio.to_thread(update_ot_summary_sheet, driver_totals, window_start, window_end)
         sheet_result = "updated" if ok else "failed"
     except Exception as e:
         sheet_result = f"error: {e}"
     # build reply text
     lines = [f"OT Summary {window_start.date()} → {window_end.date()} ({window_start.year})", ""]
     if driver_totals:
-        for drv, hrs in sorted(driver_totals.items(), key=lambda x: x[0]):
+        for drv, hrs in sorted(driver_totals.items(), key=itemgetter(0)):
             lines.append(f"{drv}\t{hrs:.2f}")
     else:
         lines.append("No records found in window.")
@@ -4290,66 +4654,18 @@ async def ot_summary_summary_command(update: Update, context: ContextTypes.DEFAU
             await update.message.reply_text(text)
         except Exception:
             pass
-
-# Register command handler if application exists
-try:
-    application.add_handler(CommandHandler("ot_summary_summary", ot_summary_summary_command))
-except Exception:
-    pass
 # === END: OT Summary integration ===
 
 # === BEGIN: lightweight /chatid command (added) ===
 async def chatid_command(update, context):
     """Return the current chat's ID. Safe, non-intrusive addition."""
-    try:
-        chat = None
-        # Prefer effective_chat when available
-        if hasattr(update, "effective_chat") and update.effective_chat is not None:
-            chat = update.effective_chat
-        elif hasattr(update, "message") and update.message and update.message.chat:
-            chat = update.message.chat
-        elif hasattr(update, "callback_query") and update.callback_query and update.callback_query.message and update.callback_query.message.chat:
-            chat = update.callback_query.message.chat
-
-        if not chat:
-            # best-effort fallback
-            try:
-                await update.effective_chat.send_message("Could not determine chat id.")
-            except Exception:
-                try:
-                    await update.message.reply_text("Could not determine chat id.")
-                except Exception:
-                    pass
-            return
-
-        cid = getattr(chat, "id", None)
-        title = getattr(chat, "title", None) or getattr(chat, "username", None) or "this chat"
-        text = f"Chat ID for {title}: {cid}"
-        try:
-            await update.effective_chat.send_message(text)
-        except Exception:
-            try:
-                await update.message.reply_text(text)
-            except Exception:
-                pass
-    except Exception as e:
-        try:
-            await update.effective_chat.send_message(f"Error retrieving chat id: {e}")
-        except Exception:
-            try:
-                await update.message.reply_text(f"Error retrieving chat id: {e}")
-            except Exception:
-                pass
-
-# Register handler if dispatcher/application exists
-try:
-    application.add_handler(CommandHandler("chatid", chatid_command))
-except Exception:
-    try:
-        # older style: dispatcher
-        dispatcher.add_handler(CommandHandler("chatid", chatid_command))
-    except Exception:
-        pass
+    # effective_chat already covers message/callback_query chats on PTB updates.
+    chat = update.effective_chat
+    if not chat:
+        return
+    title = chat.title or chat.username or "this chat"
+    with suppress(Exception):
+        await context.bot.send_message(chat.id, f"Chat ID for {title}: {chat.id}")
 # === END: lightweight /chatid command (added) ===
 
 
@@ -4363,68 +4679,146 @@ except Exception:
 SUPPORTED_STORE_PREFIX = "lang:user:"
 SUPPORTED_OVERRIDE_PREFIX = "lang:override:"
 
-# In-memory cache to reduce sheet requests (best-effort, not authoritative across processes)
-_USER_LANG_CACHE = {}
-_OVERRIDE_LANG_CACHE = {}
+# In-memory cache to reduce sheet requests (best-effort, not authoritative across processes).
+# Bounded and expiring so a long-running bot doesn't grow it forever; a miss falls back to
+# the Bot_State snapshot below.
+_LANG_CACHE_MAXSIZE = 10_000
+_LANG_CACHE_TTL = 300.0
+try:
+    from cachetools import TTLCache
+    _USER_LANG_CACHE = TTLCache(_LANG_CACHE_MAXSIZE, _LANG_CACHE_TTL)
+    _OVERRIDE_LANG_CACHE = TTLCache(_LANG_CACHE_MAXSIZE, _LANG_CACHE_TTL)
+except ImportError:
+    _USER_LANG_CACHE = {}
+    _OVERRIDE_LANG_CACHE = {}
+# TTLCache is not thread-safe and both caches are written from to_thread workers, so every
+# access goes through this lock (reads use .get(), an entry can expire at any moment).
+_lang_cache_lock = threading.Lock()
+
+# Process-wide snapshot of the Bot_State Key/Value table. Language lookups run on every
+# update, so reads are served from here and the sheet is re-read at most once per TTL.
+_BOT_STATE_SNAPSHOT: Dict[str, str] = {}
+_BOT_STATE_ROWS: Dict[str, int] = {}  # key -> 1-based sheet row, for in-place updates
+_BOT_STATE_SNAPSHOT_TS = 0.0
+_BOT_STATE_SNAPSHOT_TTL = 60.0
+_bot_state_lock = threading.Lock()
+
+def _bot_state_refresh(ws) -> None:
+    global _BOT_STATE_SNAPSHOT, _BOT_STATE_ROWS, _BOT_STATE_SNAPSHOT_TS
+    snap: Dict[str, str] = {}
+    rows: Dict[str, int] = {}
+    # Only the Key/Value columns below the header are fetched, not every column.
+    for idx, r in enumerate(ws.get_values("A2:B"), start=2):
+        k = str(r[0] if r else "").strip()
+        if k.startswith(_REPORT_SENT_PREFIX):
+            continue
+        if k and k not in snap:
+            snap[k] = str(r[1]) if len(r) > 1 else ""
+            rows[k] = idx
+    with _bot_state_lock:
+        _BOT_STATE_SNAPSHOT, _BOT_STATE_ROWS = snap, rows
+        _BOT_STATE_SNAPSHOT_TS = time.monotonic()
+    # Prime both language caches from this one read so per-user lookups never go to the
+    # sheet; values are overwritten so changes made elsewhere are picked up on refresh.
+    with _lang_cache_lock:
+        for k, v in snap.items():
+            if not v:
+                continue
+            if k.startswith(SUPPORTED_STORE_PREFIX):
+                _USER_LANG_CACHE[k[len(SUPPORTED_STORE_PREFIX):]] = v
+            elif k.startswith(SUPPORTED_OVERRIDE_PREFIX):
+                _OVERRIDE_LANG_CACHE[k[len(SUPPORTED_OVERRIDE_PREFIX):]] = v
+
+def _bot_state_snapshot(open_ws, force: bool = False) -> Dict[str, str]:
+    """Return the Bot_State snapshot, reloading it via open_ws() when stale or forced."""
+    if force or time.monotonic() - _BOT_STATE_SNAPSHOT_TS >= _BOT_STATE_SNAPSHOT_TTL:
+        ws = open_ws()
+        if ws:
+            _bot_state_refresh(ws)
+    return _BOT_STATE_SNAPSHOT
+
+def _bot_state_store(open_ws, key: str, value: str) -> bool:
+    """Write key=value to Bot_State (update in place or append) and mirror it in the snapshot."""
+    with _BOT_STATE_WRITE_LOCK:
+        return _bot_state_store_locked(open_ws, key, value)
+
+def _bot_state_store_locked(open_ws, key: str, value: str) -> bool:
+    ws = open_ws()
+    if not ws:
+        return False
+    stale = time.monotonic() - _BOT_STATE_SNAPSHOT_TS >= _BOT_STATE_SNAPSHOT_TTL
+    found_row = None if stale else _BOT_STATE_ROWS.get(key)
+    row = found_row
+    if not found_row:
+        # Fetch only the Key column to locate the row (or the next free one); this also
+        # covers keys appended earlier in this process, whose row we don't know yet.
+        keys = ws.col_values(1)
+        found_row = keys.index(key) + 1 if key in keys else None
+        row = found_row or len(keys) + 1
+    if found_row or row <= ws.row_count:
+        # Key and value go out as one A:B range write.
+        ws.update(f"A{row}:B{row}", [[key, str(value)]], value_input_option="USER_ENTERED")
+        found_row = row
+    else:
+        # Past the grid: append_row grows the sheet, a range write would be rejected.
+        ws.append_row([key, str(value)], value_input_option="USER_ENTERED")
+    with _bot_state_lock:
+        _BOT_STATE_SNAPSHOT[key] = str(value)
+        if found_row:
+            _BOT_STATE_ROWS[key] = found_row
+    return True
 
 def _kv_get(key: str) -> str:
     """Get a stored value from Bot_State worksheet by Key column. Returns empty string if missing."""
     try:
-        ws = open_bot_state_worksheet()
-        records = ws.get_all_records()
-        for r in records:
-            k = str(r.get("Key") or r.get("key") or "").strip()
-            if k == key:
-                return str(r.get("Value") or r.get("value") or "")
-        return ""
-    except Exception:
-        try:
-            logger.exception("Failed kv_get for %s", key)
-        except Exception:
-            pass
+        return _bot_state_snapshot(open_bot_state_worksheet).get(key, "")
+    except Exception as e:
+        # Bot_State worksheets are opened raw (not via WorksheetProxy), so check here.
+        _drop_sheet_handles(e)
+        _safe_log_exception("Failed kv_get for %s", key)
         return ""
 
 def _kv_set(key: str, value: str) -> bool:
     """Set a key/value pair in Bot_State worksheet. Overwrites existing key if present."""
     try:
-        ws = open_bot_state_worksheet()
-        records = ws.get_all_records()
-        found_row = None
-        for idx, r in enumerate(records, start=2):
-            k = str(r.get("Key") or r.get("key") or "").strip()
-            if k == key:
-                found_row = idx
-                break
-        if found_row:
-            ws.update_cell(found_row, 2, str(value))
-        else:
-            ws.append_row([key, str(value)], value_input_option="USER_ENTERED")
-        return True
+        return _bot_state_store(open_bot_state_worksheet, key, value)
     except Exception as e:
-        try:
-            logger.exception("Failed kv_set %s -> %s : %s", key, value, e)
-        except Exception:
-            pass
+        _drop_sheet_handles(e)
+        _safe_log_exception("Failed kv_set %s -> %s : %s", key, value, e)
         return False
 
+def _preload_lang_caches() -> None:
+    """Read Bot_State once at startup so first messages from each user hit warm caches."""
+    try:
+        _bot_state_snapshot(open_bot_state_worksheet, force=True)
+        with _lang_cache_lock:
+            n_user, n_override = len(_USER_LANG_CACHE), len(_OVERRIDE_LANG_CACHE)
+        logger.info("Preloaded %d user / %d override languages.", n_user, n_override)
+    except Exception:
+        logger.exception("lang cache preload failed")
+
 def save_user_lang(username: str, lang: str) -> bool:
     if not username or not lang:
         return False
     key = SUPPORTED_STORE_PREFIX + username
     ok = _kv_set(key, lang)
     if ok:
-        _USER_LANG_CACHE[username] = lang
+        with _lang_cache_lock:
+            _USER_LANG_CACHE[username] = lang
     return ok
 
 def get_user_lang_stored(username: str) -> str:
     if not username:
         return ""
-    if username in _USER_LANG_CACHE:
-        return _USER_LANG_CACHE[username]
+    with _lang_cache_lock:
+        cached = _USER_LANG_CACHE.get(username)
+    if cached:
+        return cached
     key = SUPPORTED_STORE_PREFIX + username
     v = _kv_get(key)
     if v:
-        _USER_LANG_CACHE[username] = v
+        with _lang_cache_lock:
+            _USER_LANG_CACHE[username] = v
     return v or ""
 
 def set_admin_override(username: str, lang: str) -> bool:
@@ -4433,18 +4827,22 @@ def set_admin_override(username: str, lang: str) -> bool:
     key = SUPPORTED_OVERRIDE_PREFIX + username
     ok = _kv_set(key, lang)
     if ok:
-        _OVERRIDE_LANG_CACHE[username] = lang
+        with _lang_cache_lock:
+            _OVERRIDE_LANG_CACHE[username] = lang
     return ok
 
 def get_admin_override(username: str) -> str:
     if not username:
         return ""
-    if username in _OVERRIDE_LANG_CACHE:
-        return _OVERRIDE_LANG_CACHE[username]
+    with _lang_cache_lock:
+        cached = _OVERRIDE_LANG_CACHE.get(username)
+    if cached:
+        return cached
     key = SUPPORTED_OVERRIDE_PREFIX + username
     v = _kv_get(key)
     if v:
-        _OVERRIDE_LANG_CACHE[username] = v
+        with _lang_cache_lock:
+            _OVERRIDE_LANG_CACHE[username] = v
     return v or ""
 
 def get_effective_lang_for_username(username: str, context=None) -> str:
@@ -4497,9 +4895,7 @@ def t(user_lang_or_update, key: str, **kwargs) -> str:
     if lang not in SUPPORTED_LANGS:
         lang = "en"
     # Try to fetch translation from TR; if missing, fall back to English string then format
-    txt_template = TR.get(lang, TR.get("en", {})).get(key)
-    if txt_template is None:
-        txt_template = TR.get("en", {}).get(key, "")
+    txt_template = _resolve_template(lang, key)
     try:
         return txt_template.format(**kwargs)
     except Exception:
@@ -4508,23 +4904,25 @@ def t(user_lang_or_update, key: str, **kwargs) -> str:
         except Exception:
             return ""
 
-# Sync handler: ensure context.user_data['lang'] matches persisted/override when user interacts.
-async def sync_user_lang(update, context):
-    try:
-        user = update.effective_user if hasattr(update, "effective_user") else None
-        if not user or not getattr(user, "username", None):
-            return
-        username = user.username
-        eff = get_effective_lang_for_username(username, context=context)
-        cur = context.user_data.get("lang")
-        if cur != eff:
-            context.user_data["lang"] = eff
-    except Exception:
-        try:
-            logger.exception("sync_user_lang failed")
-        except Exception:
-            pass
-    # Do not block other handlers; always return without replying.
+# Resolve the user's language on demand (only in handlers that render text) and keep it
+# on context.user_data, instead of syncing it for every incoming update. The cached value
+# is re-resolved after _LANG_RECHECK_SEC so admin overrides still reach the user.
+_LANG_RECHECK_SEC = 600.0
+
+def _resolve_lang(update, context) -> str:
+    ud = context.user_data
+    lang = ud.get("lang")
+    # Wall-clock time: user_data is persisted across restarts.
+    if lang and time.time() - ud.get("_lang_checked_at", 0.0) < _LANG_RECHECK_SEC:
+        return lang
+    user = getattr(update, "effective_user", None)
+    username = getattr(user, "username", None)
+    if lang and not username:
+        return lang
+    lang = get_effective_lang_for_username(username, context=context)
+    ud["lang"] = lang
+    ud["_lang_checked_at"] = time.time()
+    return lang
 
 # Command: /setlang <lang>
 async def setlang_command(update, context):
@@ -4539,12 +4937,12 @@ async def setlang_command(update, context):
         return
     lang = args[0].lower()
     if lang not in SUPPORTED_LANGS:
-        await update.effective_chat.send_message("Supported langs: " + ", ".join(SUPPORTED_LANGS))
+        await update.effective_chat.send_message("Supported langs: " + ", ".join(sorted(SUPPORTED_LANGS)))
         return
     user = update.effective_user
     username = user.username if user else None
     if username:
-        ok = save_user_lang(username, lang)
+        ok = await asyncio.to_thread(save_user_lang, username, lang)
         context.user_data["lang"] = lang
         if ok:
             await update.effective_chat.send_message(t(lang, "lang_set", lang=lang))
@@ -4560,10 +4958,12 @@ async def mylang_command(update, context):
     if not username:
         await update.effective_chat.send_message("No username found for your account.")
         return
-    eff = get_effective_lang_for_username(username, context=context)
+    eff = _resolve_lang(update, context)
     await update.effective_chat.send_message(f"Your language: {eff}")
 
 # Command: /forcelang <username> <lang>  (admin only)
+_FORCELANG_ADMINS = frozenset(u.strip() for u in (os.getenv('BOT_ADMINS_DEFAULT') or BOT_ADMINS_DEFAULT).split(",") if u.strip())
+
 async def forcelang_command(update, context):
     try:
         if update.effective_message:
@@ -4572,7 +4972,7 @@ async def forcelang_command(update, context):
         pass
     user = update.effective_user
     username = user.username if user else None
-    if not username or username not in [u.strip() for u in (os.getenv('BOT_ADMINS_DEFAULT') or BOT_ADMINS_DEFAULT).split(",") if u.strip()]:
+    if not username or username not in _FORCELANG_ADMINS:
         await update.effective_chat.send_message("❌ You are not an admin for this operation.")
         return
     args = context.args or []
@@ -4582,44 +4982,22 @@ async def forcelang_command(update, context):
     target = args[0].strip()
     lang = args[1].lower().strip()
     if lang not in SUPPORTED_LANGS:
-        await update.effective_chat.send_message("Supported langs: " + ", ".join(SUPPORTED_LANGS))
+        await update.effective_chat.send_message("Supported langs: " + ", ".join(sorted(SUPPORTED_LANGS)))
         return
-    ok = set_admin_override(target, lang)
+    ok = await asyncio.to_thread(set_admin_override, target, lang)
     if ok:
         await update.effective_chat.send_message(f"Set admin override for {target} → {lang}")
     else:
         await update.effective_chat.send_message("Failed to set admin override.")
 
-# Register handlers if application object exists (best-effort, non-invasive)
-try:
-    application.add_handler(MessageHandler(filters.ALL, sync_user_lang), group=0)
-    application.add_handler(CommandHandler("setlang", setlang_command))
-    application.add_handler(CommandHandler("mylang", mylang_command))
-    application.add_handler(CommandHandler("forcelang", forcelang_command))
-except Exception:
-    # If 'application' is not yet defined at import time, registration will be attempted in main()
-    pass
-
-# Also attempt to register during main() if register hook available
-try:
-    def register_multilang_handlers(app):
-        try:
-            app.add_handler(MessageHandler(filters.ALL, sync_user_lang), group=0)
-            app.add_handler(CommandHandler("setlang", setlang_command))
-            app.add_handler(CommandHandler("mylang", mylang_command))
-            app.add_handler(CommandHandler("forcelang", forcelang_command))
-        except Exception:
-            pass
-    globals().setdefault("register_multilang_handlers", register_multilang_handlers)
-except Exception:
-    pass
-
-# Ensure Khmer entry exists in TR (placeholder copy of English strings) so user can paste full KH translations later.
+# Ensure Khmer entry exists in TR so user can paste full KH translations later. Missing keys
+# fall back to English through a ChainMap view instead of copying every English string;
+# writes (e.g. setdefault below) land in the Khmer dict, so authored KH strings win.
 if "km" not in TR:
     TR["km"] = {}
-for k, v in list(TR.get("en", {}).items()):
-    if k not in TR.get("km", {}):
-        TR["km"][k] = v  # placeholder: copy English (user will replace with full KH translations)
+if not isinstance(TR["km"], ChainMap):
+    TR["km"] = ChainMap(TR["km"], TR.get("en", {}))
+_resolve_template.cache_clear()
 
 # === END: MULTILANG EXTENSION ===
 
@@ -4701,6 +5079,11 @@ def _safe_get_col_index(rowkeys, candidates):
     return -1
 
 
+# (mentions PP, mentions SHV) -> type for single-city descriptions; mixed or empty ones fall
+# through to the token heuristic in mission_report_command.
+_MISSION_TYPE_BY_CITIES = {(True, False): "PP Mission", (False, True): "SHV mission"}
+_MISSION_DESC_SPLIT_RE = re.compile(r"[\s,;\/\-]+")
+
 async def mission_report_command(update, context):
     try:
         if update.effective_message:
@@ -4748,10 +5131,10 @@ async def mission_report_command(update, context):
                 # determine mission type based on description sequence heuristics
                 # Simple rule as requested: if description contains pattern "PP-SHV-PP" or similar, decide accordingly.
                 desc_upper = desc.upper()
-                mission_type = "PP Mission" if "PP" in desc_upper and "SHV" not in desc_upper else "SHV mission" if "SHV" in desc_upper and "PP" not in desc_upper else None
-                # heuristic for mixed sequences: check tokens
-                tokens = re.split(r"[\s,;\/\-]+", desc_upper)
+                mission_type = _MISSION_TYPE_BY_CITIES.get(("PP" in desc_upper, "SHV" in desc_upper))
                 if not mission_type:
+                    # heuristic for mixed sequences: check tokens
+                    tokens = _MISSION_DESC_SPLIT_RE.split(desc_upper)
                     # find pattern e.g., PP SHV PP -> treat as SHV mission (per requirement)
                     seq = "".join([t for t in tokens if t in ("PP","SHV")])
                     if "PPSHVP P" in seq:
@@ -4774,13 +5157,15 @@ async def mission_report_command(update, context):
         files = []
         for username, data in per_driver.items():
             name = data.get("name") or username
-            missions = sorted(data.get("missions", []), key=lambda x: x[0])
+            missions = sorted(data.get("missions", []), key=itemgetter(0))
             csv_path = f"/tmp/mission_report_{username}_{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}.csv"
             with open(csv_path, "w", newline='', encoding="utf-8") as cf:
                 writer = csv.writer(cf)
                 writer.writerow(["Name","Mission Start Date","Mission End Date","Duration(day)","Description","Mission Type"])
-                for s_dt, e_dt, dur, mtype, desc in missions:
-                    writer.writerow([name, s_dt.strftime("%Y-%m-%d"), e_dt.strftime("%Y-%m-%d"), str(dur), desc, mtype])
+                writer.writerows(
+                    [name, s_dt.strftime("%Y-%m-%d"), e_dt.strftime("%Y-%m-%d"), str(dur), desc, mtype]
+                    for s_dt, e_dt, dur, mtype, desc in missions
+                )
             files.append(csv_path)
         zip_path = f"/tmp/mission_reports_{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}.zip"
         with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
@@ -4791,10 +5176,7 @@ async def mission_report_command(update, context):
         except Exception:
             await update.effective_chat.send_message(t(context, "mission_report_sent_files", count=len(files)))
     except Exception as e:
-        try:
-            logger.exception("mission_report failed: %s", e)
-        except Exception:
-            pass
+        _safe_log_exception("mission_report failed: %s", e)
         await update.effective_chat.send_message(t(context, "mission_report_failed"))
 
 
@@ -4813,334 +5195,13 @@ try:
     TR_k.setdefault("mission_report_failed", "បរាជ័យក្នុងការបង្កើត Mission report។")
 except Exception:
     pass
+_resolve_template.cache_clear()
 
 # === END: OT & MISSION REPORTS EXTENSION ===
 
 
-# === BEGIN: MULTILANG PERSISTENCE & COMMANDS (ADDED) ===
-# Provides per-user language choice (en/km) stored in Bot_State worksheet (Key/Value),
-# admin override, and commands /setlang, /mylang, /forcelang.
-# This extension is non-invasive: it adds handlers and helper functions only.
-
-SUPPORTED_LANGS = ["en", "km"]
-LANG_STORE_PREFIX = "lang:user:"
-LANG_OVERRIDE_PREFIX = "lang:override:"
-
-_USER_LANG_CACHE = {}
-_OVERRIDE_LANG_CACHE = {}
-
-def _open_bot_state_ws():
-    # prefer existing helper open_bot_state_worksheet() if available
-    try:
-        return open_bot_state_worksheet()
-    except Exception:
-        try:
-            return open_worksheet(BOT_STATE_TAB)
-        except Exception:
-            # best-effort: try open_worksheet_by_name
-            try:
-                return open_worksheet_by_name("Bot_State")
-            except Exception:
-                return None
-
-def _kv_get(key: str) -> str:
-    try:
-        ws = _open_bot_state_ws()
-        if not ws:
-            return ""
-        records = ws.get_all_records()
-        for r in records:
-            k = str(r.get("Key") or r.get("key") or "").strip()
-            if k == key:
-                return str(r.get("Value") or r.get("value") or "")
-        return ""
-    except Exception:
-        try:
-            logger.exception("kv_get failed for %s", key)
-        except Exception:
-            pass
-        return ""
-
-def _kv_set(key: str, value: str) -> bool:
-    try:
-        ws = _open_bot_state_ws()
-        if not ws:
-            return False
-        records = ws.get_all_records()
-        found_row = None
-        for idx, r in enumerate(records, start=2):
-            k = str(r.get("Key") or r.get("key") or "").strip()
-            if k == key:
-                found_row = idx
-                break
-        if found_row:
-            ws.update_cell(found_row, 2, str(value))
-        else:
-            ws.append_row([key, str(value)], value_input_option="USER_ENTERED")
-        return True
-    except Exception:
-        try:
-            logger.exception("kv_set failed for %s", key)
-        except Exception:
-            pass
-        return False
-
-def save_user_lang(username: str, lang: str) -> bool:
-    if not username or not lang:
-        return False
-    lang = lang.lower()
-    if lang not in SUPPORTED_LANGS:
-        return False
-    key = LANG_STORE_PREFIX + username
-    ok = _kv_set(key, lang)
-    if ok:
-        _USER_LANG_CACHE[username] = lang
-    return ok
-
-def get_user_lang_stored(username: str) -> str:
-    if not username:
-        return ""
-    if username in _USER_LANG_CACHE:
-        return _USER_LANG_CACHE[username]
-    key = LANG_STORE_PREFIX + username
-    v = _kv_get(key)
-    if v:
-        _USER_LANG_CACHE[username] = v
-    return v or ""
-
-def set_admin_override(username: str, lang: str) -> bool:
-    if not username:
-        return False
-    lang = lang.lower()
-    if lang not in SUPPORTED_LANGS:
-        return False
-    key = LANG_OVERRIDE_PREFIX + username
-    ok = _kv_set(key, lang)
-    if ok:
-        _OVERRIDE_LANG_CACHE[username] = lang
-    return ok
-
-def get_admin_override(username: str) -> str:
-    if not username:
-        return ""
-    if username in _OVERRIDE_LANG_CACHE:
-        return _OVERRIDE_LANG_CACHE[username]
-    key = LANG_OVERRIDE_PREFIX + username
-    v = _kv_get(key)
-    if v:
-        _OVERRIDE_LANG_CACHE[username] = v
-    return v or ""
-
-def resolve_effective_lang(username: str, context=None) -> str:
-    if not username:
-        return DEFAULT_LANG if 'DEFAULT_LANG' in globals() else "en"
-    ov = get_admin_override(username)
-    if ov:
-        return ov.lower()
-    st = get_user_lang_stored(username)
-    if st:
-        return st.lower()
-    # fallback to context.user_data if provided
-    try:
-        if context and hasattr(context, "user_data"):
-            ctx_lang = context.user_data.get("lang")
-            if ctx_lang:
-                return ctx_lang.lower()
-    except Exception:
-        pass
-    return DEFAULT_LANG if 'DEFAULT_LANG' in globals() else "en"
-
-# Wrap existing t() to accept update/context or explicit lang
-_old_t = globals().get("t")
-def t(user_lang_or_update, key: str, **kwargs) -> str:
-    # Determine language
-    lang = None
-    try:
-        if hasattr(user_lang_or_update, "effective_user") or hasattr(user_lang_or_update, "message"):
-            update = user_lang_or_update
-            ctx = kwargs.pop("_context", None)
-            username = None
-            try:
-                username = update.effective_user.username if update and update.effective_user else None
-            except Exception:
-                username = None
-            if username:
-                lang = resolve_effective_lang(username, context=ctx)
-        elif isinstance(user_lang_or_update, str) and len(user_lang_or_update) <= 3:
-            lang = user_lang_or_update.lower()
-        else:
-            # fallback to default
-            lang = DEFAULT_LANG if 'DEFAULT_LANG' in globals() else "en"
-    except Exception:
-        lang = DEFAULT_LANG if 'DEFAULT_LANG' in globals() else "en"
-    if lang not in SUPPORTED_LANGS:
-        lang = "en"
-    # Use TR dict if present
-    try:
-        tr = TR.get(lang, TR.get("en", {}))
-        txt_template = tr.get(key, TR.get("en", {}).get(key, ""))
-        return txt_template.format(**kwargs)
-    except Exception:
-        try:
-            return str(TR.get("en", {}).get(key, "")).format(**kwargs)
-        except Exception:
-            return ""
-
-# Sync handler to keep context.user_data['lang'] updated when users interact
-async def _sync_user_lang(update, context):
-    try:
-        user = update.effective_user if hasattr(update, "effective_user") else None
-        if not user or not getattr(user, "username", None):
-            return
-        username = user.username
-        eff = resolve_effective_lang(username, context=context)
-        cur = context.user_data.get("lang")
-        if cur != eff:
-            context.user_data["lang"] = eff
-    except Exception:
-        try:
-            logger.exception("sync_user_lang failed")
-        except Exception:
-            pass
-    # do not send messages
-
-# Command handlers
-async def cmd_setlang(update, context):
-    try:
-        if update.effective_message:
-            await update.effective_message.delete()
-    except Exception:
-        pass
-    args = context.args or []
-    if not args:
-        await update.effective_chat.send_message("Usage: /setlang en|km")
-        return
-    lang = args[0].lower()
-    if lang not in SUPPORTED_LANGS:
-        await update.effective_chat.send_message("Supported: " + ", ".join(SUPPORTED_LANGS))
-        return
-    user = update.effective_user
-    uname = user.username if user else None
-    if not uname:
-        await update.effective_chat.send_message("Cannot determine username; cannot persist language.")
-        return
-    ok = save_user_lang(uname, lang)
-    context.user_data["lang"] = lang
-    if ok:
-        await update.effective_chat.send_message(t(lang, "lang_set", lang=lang))
-    else:
-        await update.effective_chat.send_message("Failed to persist language setting.")
-
-async def cmd_mylang(update, context):
-    user = update.effective_user
-    uname = user.username if user else None
-    if not uname:
-        await update.effective_chat.send_message("No username found.")
-        return
-    eff = resolve_effective_lang(uname, context=context)
-    await update.effective_chat.send_message(f"Your language: {eff}")
-
-async def cmd_forcelang(update, context):
-    try:
-        if update.effective_message:
-            await update.effective_message.delete()
-    except Exception:
-        pass
-    user = update.effective_user
-    uname = user.username if user else None
-    # check admin: prefer BOT_ADMINS env var then BOT_ADMINS_DEFAULT global
-    admins = []
-    try:
-        if os.getenv("BOT_ADMINS"):
-            admins = [x.strip() for x in os.getenv("BOT_ADMINS").split(",") if x.strip()]
-        elif 'BOT_ADMINS_DEFAULT' in globals():
-            admins = [x.strip() for x in BOT_ADMINS_DEFAULT.split(",") if x.strip()]
-    except Exception:
-        admins = []
-    if not uname or uname not in admins:
-        await update.effective_chat.send_message("❌ You are not an admin for this operation.")
-        return
-    args = context.args or []
-    if len(args) < 2:
-        await update.effective_chat.send_message("Usage: /forcelang <username> <en|km>")
-        return
-    target = args[0].strip()
-    lang = args[1].lower().strip()
-    if lang not in SUPPORTED_LANGS:
-        await update.effective_chat.send_message("Supported: " + ", ".join(SUPPORTED_LANGS))
-        return
-    ok = set_admin_override(target, lang)
-    if ok:
-        await update.effective_chat.send_message(f"Set admin override for {target} → {lang}")
-    else:
-        await update.effective_chat.send_message("Failed to set admin override.")
-
-# Register handlers if application object is present
-try:
-    application.add_handler(CommandHandler("setlang", cmd_setlang))
-    application.add_handler(CommandHandler("mylang", cmd_mylang))
-    application.add_handler(CommandHandler("forcelang", cmd_forcelang))
-    application.add_handler(MessageHandler(filters.ALL, _sync_user_lang), group=0)
-except Exception:
-    # expose a function to register later
-    def register_multilang(app):
-        try:
-            app.add_handler(CommandHandler("setlang", cmd_setlang))
-            app.add_handler(CommandHandler("mylang", cmd_mylang))
-            app.add_handler(CommandHandler("forcelang", cmd_forcelang))
-            app.add_handler(MessageHandler(filters.ALL, _sync_user_lang), group=0)
-        except Exception:
-            pass
-    globals().setdefault("register_multilang", register_multilang)
-
-# Ensure TR has km entry – if missing, copy en (user can replace with more natural KH later)
-try:
-    if "TR" in globals() and isinstance(TR, dict):
-        if "km" not in TR:
-            TR["km"] = {}
-        for k, v in TR.get("en", {}).items():
-            if k not in TR["km"]:
-                # placeholder: copy English; earlier we may have partial translations; do not overwrite existing entries
-                if not TR["km"].get(k):
-                    TR["km"][k] = v
-except Exception:
-    pass
-
-# === END MULTILANG EXTENSION ===
-
 
-# Auto-register bot commands (so they appear in Telegram UI)
-def _register_bot_commands(app):
-    try:
-        from telegram import BotCommand
-        cmds = [
-            BotCommand("setlang", "Set your language (en/km)"),
-            BotCommand("mylang", "Show your current language"),
-            BotCommand("forcelang", "Admin: force language for a user"),
-        ]
-        try:
-            # PTB v20: application.bot.set_my_commands exists
-            app.bot.set_my_commands(cmds)
-        except Exception:
-            try:
-                app.set_my_commands(cmds)
-            except Exception:
-                pass
-    except Exception:
-        try:
-            logger.exception("Failed to register bot commands")
-        except Exception:
-            pass
-
-# If application is present, register commands now
-try:
-    if 'application' in globals() and application is not None:
-        _register_bot_commands(application)
-except Exception:
-    pass
 
-# Also expose helper for explicit call
-globals().setdefault("register_bot_commands", _register_bot_commands)
 
 
 from telegram.ext import CommandHandler, CallbackQueryHandler
@@ -5157,26 +5218,6 @@ async def reply_private(update, context, text, **kwargs):
         **kwargs
     )
 
-# ---- Language command ----
-async def lang_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    msg = update.effective_message
-    args = context.args or []
-
-    if not args:
-        await reply_private(update, context, "Usage: /lang en | km")
-        return
-
-    lang = args[0].lower()
-    if lang not in ("en", "km"):
-        await reply_private(update, context, "Unsupported language. Use: en / km")
-        return
-
-    context.user_data["lang"] = lang
-
-    if lang == "en":
-        await reply_private(update, context, "Language set to English.")
-    else:
-        await reply_private(update, context, "បានកំណត់ភាសាជាភាសាខ្មែរ。")
 async def reports_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     kb = [
         [InlineKeyboardButton("OT Report", callback_data="rep_ot")],
@@ -5193,31 +5234,40 @@ async def reports_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # ---- Callback handler ----
+_LANG_CALLBACKS = {
+    "lang_en": ("en", "Language set to English"),
+    "lang_km": ("km", "Language set to Khmer"),
+}
+_REPORT_CALLBACKS = {
+    "rep_ot": "Use: /ot_report <username> YYYY-MM",
+    "rep_otm": "Use: /ot_monthly_report YYYY-MM <username>",
+    "rep_mm": "Use: /mission_monthly_report YYYY-MM <username>",
+}
+
 async def c_safe_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     data = q.data
 
-    if data == "lang_en":
-        context.user_data["lang"] = "en"
-        await q.edit_message_text("Language set to English")
-    elif data == "lang_km":
-        context.user_data["lang"] = "km"
-        await q.edit_message_text("Language set to Khmer")
-    elif data == "rep_ot":
-        await q.edit_message_text("Use: /ot_report <username> YYYY-MM")
-    elif data == "rep_otm":
-        await q.edit_message_text("Use: /ot_monthly_report YYYY-MM <username>")
-    elif data == "rep_mm":
-        await q.edit_message_text("Use: /mission_monthly_report YYYY-MM <username>")
-
-# ---- Register handlers ----
-try:
-    application.add_handler(CommandHandler("lang", lang_command))
-    application.add_handler(CommandHandler("reports", reports_menu))
-    application.add_handler(CallbackQueryHandler(c_safe_callback, pattern="^(lang_|rep_)"))
-except Exception:
-    pass
+    if data in _LANG_CALLBACKS:
+        lang, text = _LANG_CALLBACKS[data]
+        context.user_data["lang"] = lang
+        context.user_data["_lang_checked_at"] = time.time()
+        await q.edit_message_text(text)
+    elif data in _REPORT_CALLBACKS:
+        await q.edit_message_text(_REPORT_CALLBACKS[data])
+
+def register_all_handlers(app):
+    """Handlers from the sections above; registered once from build_application()."""
+    app.add_handler(CommandHandler("ot_summary_summary", ot_summary_summary_command))
+    app.add_handler(CommandHandler("chatid", chatid_command))
+    app.add_handler(CommandHandler("setlang", setlang_command))
+    app.add_handler(CommandHandler("mylang", mylang_command))
+    app.add_handler(CommandHandler("forcelang", forcelang_command))
+    app.add_handler(CommandHandler("reports", reports_menu))
+    app.add_handler(CallbackQueryHandler(c_safe_callback, pattern="^(lang_|rep_)"))
+    # Catch-all callback handler goes last so the patterned handlers above get first match.
+    app.add_handler(CallbackQueryHandler(plate_callback))
 
 # =============================
 # OT Holiday Base (FROZEN)
@@ -5269,12 +5319,12 @@ def _auto_close_previous_in(ws, driver, new_in_time):
     rows = ws.get_all_values()
     if len(rows) < 2:
         return
-    header = rows[0]
+    header = _header_index(tuple(rows[0]))
     data = rows[1:]
-    idx_driver = header.index("Name")
-    idx_action = header.index("Action")
-    idx_time = header.index("Time")
-    idx_end = header.index("End Time") if "End Time" in header else None
+    idx_driver = header["Name"]
+    idx_action = header["Action"]
+    idx_time = header["Time"]
+    idx_end = header.get("End Time")
 
     for i in range(len(data)-1, -1, -1):
         r = data[i]
@@ -5283,8 +5333,12 @@ def _auto_close_previous_in(ws, driver, new_in_time):
             auto_out = last_in.replace(hour=4, minute=0, second=0)
             if auto_out <= last_in:
                 auto_out += timedelta(days=1)
-            ws.update_cell(i+2, idx_action+1, "OUT")
-            ws.update_cell(i+2, idx_time+1, auto_out.strftime("%Y-%m-%d %H:%M:%S"))
+            # Action and Time in one values.batchUpdate (the columns need not be adjacent).
+            ws.batch_update([
+                {"range": gspread.utils.rowcol_to_a1(i+2, idx_action+1), "values": [["OUT"]]},
+                {"range": gspread.utils.rowcol_to_a1(i+2, idx_time+1), "values": [[auto_out.strftime("%Y-%m-%d %H:%M:%S")]]},
+            ], value_input_option="USER_ENTERED")
+            _drop_cached_values(ws.title)
             return
 
 # === CLOCK HANDLER END ===
@@ -5303,3 +5357,7 @@ from telegram.ext import CallbackQueryHandler, CommandHandler
 
 # ===================== HOTFIX OVERRIDES (AUTO-GENERATED) =====================
 # This section intentionally overrides logic without touching original code.
+
+
+if __name__ == "__main__":
+    main()